@@ -5,9 +5,20 @@ Runs in background thread, constantly analyzing frames
 import cv2
 import threading
 import time
-from datetime import datetime
 from detector import DrowsinessDetector
 from emotion_detector import EmotionDetector
+from mjpeg_stream import MJPEGStream
+from timestamps import now_iso
+
+
+def rounded_ratios(result):
+    """EAR/MAR values of a detection result, rounded for API output (raw floats are stored per frame)"""
+    return {
+        'ear_right': round(result['ear_right'], 3),
+        'ear_left': round(result['ear_left'], 3),
+        'ear_avg': round(result['ear_avg'], 3),
+        'mar': round(result['mar'], 3)
+    }
 
 
 class ContinuousDetector:
@@ -44,7 +55,8 @@ class ContinuousDetector:
         self.cap = None
         self.frame_count = 0
         self.fps = 0
-        self.last_fps_time = time.time()
+        self.last_fps_time = time.monotonic()
+        self.target_period = 1.0 / 30  # ~30 FPS max
         
         # Emotion detector
         self.emotion_detector = EmotionDetector()
@@ -52,9 +64,17 @@ class ContinuousDetector:
         # Latest frame (for streaming if needed)
         self.latest_frame = None
         
+        # Newest camera frame handed from the capture thread to the detection thread
+        self._capture_thread = None
+        self._frame_cond = threading.Condition()
+        self._newest_frame = None
+        
         # Alert callback for notifications
         self.alert_callback = None
         
+        # Frame result callback (called with every new latest_result snapshot)
+        self.frame_callback = None
+        
         # Duration-based alert tracking (different durations for each type)
         self.DROWSINESS_DURATION_SECONDS = 2.0  # 2 secondes pour somnolence
         self.YAWNING_DURATION_SECONDS = 1.0     # 1 seconde pour bâillement (plus rapide)
@@ -75,6 +95,11 @@ class ContinuousDetector:
         self.alert_callback = callback
         print("✅ Alert callback registered")
     
+    def set_frame_callback(self, callback):
+        """Set callback function to be called with each new detection result"""
+        self.frame_callback = callback
+        print("✅ Frame result callback registered")
+    
     def start(self):
         """Start continuous detection in background thread"""
         if self.is_running:
@@ -108,88 +133,129 @@ class ContinuousDetector:
             self.detector = DrowsinessDetector()
             
             # Open camera
-            self.cap = cv2.VideoCapture(self.camera_index)
+            if str(self.camera_index).startswith("http"):
+                # Network MJPEG stream (DroidCam), parsed directly instead of through FFmpeg
+                self.cap = MJPEGStream(self.camera_index)
+            else:
+                self.cap = cv2.VideoCapture(self.camera_index)
+                # Keep only the newest frame in the backend buffer (default holds ~4)
+                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            
             if not self.cap.isOpened():
                 print("❌ Cannot open camera")
-                self.latest_result['message'] = "ERROR: Cannot open camera"
+                self.latest_result = {**self.latest_result, 'message': "ERROR: Cannot open camera"}
                 self.is_running = False
                 return
             
             print("✅ Camera opened successfully")
             
-            # Warm up camera
+            # Warm up camera (grab only, skipped frames are never decoded)
             for _ in range(10):
-                self.cap.read()
+                self.cap.grab()
+            
+            # Camera I/O runs in its own thread so network reads overlap with inference
+            self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
             
             # Main loop
             while self.is_running:
-                ret, frame = self.cap.read()
+                loop_start = time.monotonic()
+                frame = self._wait_for_frame()
                 
-                if not ret:
-                    print("⚠️  Cannot read frame")
-                    time.sleep(0.1)
+                if frame is None:
                     continue
                 
                 # Flip frame (mirror effect)
                 frame = cv2.flip(frame, 1)
-                self.latest_frame = frame.copy()
+                # Publish the reference only: frames are never modified after this point
+                self.latest_frame = frame
                 
                 # Run detection
-                result = self.detector.analyze_with_thresholds(
+                result = self.detector.detect(
                     frame,
                     ear_threshold=self.ear_threshold,
                     mar_threshold=self.mar_threshold
                 )
                 
-                # Update latest result
+                # Publish a new result dict in one (atomic) rebind, readers never see a partial update
+                emotion = self.emotion_detector.snapshot
                 self.latest_result = {
-                    'timestamp': datetime.now().isoformat(),
+                    'timestamp': now_iso(),
                     'face_detected': result['face_detected'],
-                    'ear_right': round(result['ear_right'], 3),
-                    'ear_left': round(result['ear_left'], 3),
-                    'ear_avg': round(result['ear_avg'], 3),
-                    'mar': round(result['mar'], 3),
+                    'ear_right': result['ear_right'],
+                    'ear_left': result['ear_left'],
+                    'ear_avg': result['ear_avg'],
+                    'mar': result['mar'],
                     'eyes_closed': result['eyes_closed'],
                     'yawning': result['yawning'],
                     'alert_level': self._get_alert_level(result),
                     'message': self._get_message(result),
-                    'current_emotion': self.emotion_detector.current_emotion,
-                    'emotion_scores': self.emotion_detector.emotion_scores.copy()
+                    'current_emotion': emotion.emotion,
+                    'emotion_scores': emotion.scores
                 }
                 
-                # Emotion detection (threaded)
-                if self.emotion_detector.should_analyze():
-                    analysis_frame = frame.copy()
-                    emotion_thread = threading.Thread(
-                        target=self.emotion_detector.analyze_frame,
-                        args=(analysis_frame,)
-                    )
-                    emotion_thread.daemon = True
-                    emotion_thread.start()
+                # Push the new result to listeners
+                if self.frame_callback:
+                    try:
+                        self.frame_callback(self.latest_result)
+                    except Exception as e:
+                        print(f"❌ Error calling frame callback: {e}")
+                
+                # Emotion detection (persistent worker thread, frame is not modified afterwards)
+                if self.emotion_detector.should_analyze(loop_start):
+                    self.emotion_detector.submit(frame)
                 
                 # Check if we need to send alert notification
                 self._check_and_send_alert(result)
                 
                 # Calculate FPS
                 self.frame_count += 1
-                if time.time() - self.last_fps_time >= 1.0:
+                if time.monotonic() - self.last_fps_time >= 1.0:
                     self.fps = self.frame_count
                     self.frame_count = 0
-                    self.last_fps_time = time.time()
+                    self.last_fps_time = time.monotonic()
                 
-                # Small delay to not overload CPU
-                time.sleep(0.03)  # ~30 FPS max
+                # Only sleep for what is left of the frame period (none if we're behind)
+                elapsed = time.monotonic() - loop_start
+                time.sleep(max(0, self.target_period - elapsed))
         
         except Exception as e:
             print(f"❌ Error in detection loop: {e}")
-            self.latest_result['message'] = f"ERROR: {str(e)}"
+            self.latest_result = {**self.latest_result, 'message': f"ERROR: {str(e)}"}
         
         finally:
+            self.is_running = False
+            if self._capture_thread:
+                self._capture_thread.join(timeout=2)
             if self.cap:
                 self.cap.release()
             if self.detector:
                 self.detector.close()
     
+    def _capture_loop(self):
+        """Camera capture loop running in its own thread, publishes the newest frame"""
+        # Reading continuously keeps the camera buffer drained, so the published frame is always fresh
+        while self.is_running:
+            ret, frame = self.cap.read()
+            
+            if not ret:
+                print("⚠️  Cannot read frame")
+                time.sleep(0.1)
+                continue
+            
+            with self._frame_cond:
+                self._newest_frame = frame
+                self._frame_cond.notify()
+    
+    def _wait_for_frame(self, timeout=1.0):
+        """Block until the capture thread publishes a new frame and take it (None on timeout)"""
+        with self._frame_cond:
+            if self._newest_frame is None:
+                self._frame_cond.wait(timeout)
+            frame = self._newest_frame
+            self._newest_frame = None
+        return frame
+    
     def _get_alert_level(self, result):
         """Determine alert level from detection result"""
         if not result['face_detected']:
@@ -215,7 +281,7 @@ class ContinuousDetector:
         if not self.alert_callback:
             return
         
-        current_time = time.time()
+        current_time = time.monotonic()
         
         if not result['face_detected']:
             # Reset all timers when no face detected
@@ -239,7 +305,7 @@ class ContinuousDetector:
                 alert_data = {
                     'type': 'alert',
                     'alert_type': 'drowsiness',
-                    'timestamp': datetime.now().isoformat(),
+                    'timestamp': now_iso(),
                     'ear_avg': round(result['ear_avg'], 3),
                     'mar': round(result['mar'], 3),
                     'duration': round(duration, 1),
@@ -271,7 +337,7 @@ class ContinuousDetector:
                 alert_data = {
                     'type': 'alert',
                     'alert_type': 'yawning',
-                    'timestamp': datetime.now().isoformat(),
+                    'timestamp': now_iso(),
                     'ear_avg': round(result['ear_avg'], 3),
                     'mar': round(result['mar'], 3),
                     'duration': round(duration, 1),
@@ -291,27 +357,34 @@ class ContinuousDetector:
     
     def get_latest_result(self):
         """Get the latest detection result with duration info"""
-        result = self.latest_result.copy()
-        current_time = time.time()
+        base = self.latest_result  # immutable snapshot, no copy or lock needed
+        current_time = time.monotonic()
         
         # Add duration info for debugging
         if self.drowsiness_start_time is not None:
-            result['drowsiness_duration'] = round(current_time - self.drowsiness_start_time, 1)
-            result['drowsiness_progress'] = round(min(100, (result['drowsiness_duration'] / self.DROWSINESS_DURATION_SECONDS) * 100), 1)
+            drowsiness_duration = round(current_time - self.drowsiness_start_time, 1)
+            drowsiness_progress = round(min(100, (drowsiness_duration / self.DROWSINESS_DURATION_SECONDS) * 100), 1)
         else:
-            result['drowsiness_duration'] = 0.0
-            result['drowsiness_progress'] = 0.0
+            drowsiness_duration = 0.0
+            drowsiness_progress = 0.0
         
         if self.yawning_start_time is not None:
-            result['yawning_duration'] = round(current_time - self.yawning_start_time, 1)
-            result['yawning_progress'] = round(min(100, (result['yawning_duration'] / self.YAWNING_DURATION_SECONDS) * 100), 1)
+            yawning_duration = round(current_time - self.yawning_start_time, 1)
+            yawning_progress = round(min(100, (yawning_duration / self.YAWNING_DURATION_SECONDS) * 100), 1)
         else:
-            result['yawning_duration'] = 0.0
-            result['yawning_progress'] = 0.0
+            yawning_duration = 0.0
+            yawning_progress = 0.0
         
-        result['drowsiness_threshold'] = self.DROWSINESS_DURATION_SECONDS
-        result['yawning_threshold'] = self.YAWNING_DURATION_SECONDS
-        return result
+        return {
+            **base,
+            **rounded_ratios(base),
+            'drowsiness_duration': drowsiness_duration,
+            'drowsiness_progress': drowsiness_progress,
+            'yawning_duration': yawning_duration,
+            'yawning_progress': yawning_progress,
+            'drowsiness_threshold': self.DROWSINESS_DURATION_SECONDS,
+            'yawning_threshold': self.YAWNING_DURATION_SECONDS
+        }
     
     def get_latest_frame(self):
         """Get the latest frame (for streaming)"""
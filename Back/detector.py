@@ -3,10 +3,11 @@ Drowsiness Detection Module for Raspberry Pi 4
 Extracted from main_combined_raspberrypi4.py
 Optimized for FastAPI backend
 """
+import os
 import cv2
 import mediapipe as mp
 import numpy as np
-from scipy.spatial import distance
+from kernels import analyze
 
 
 # ============================================================================
@@ -34,39 +35,48 @@ POINTS_MAR = [
     310   # Lèvre inférieure droite
 ]
 
+# Index arrays for fancy-indexing the per-frame landmark array
+POINTS_EAR_DROIT_ARR = np.asarray(POINTS_EAR_DROIT, dtype=np.intp)
+POINTS_EAR_GAUCHE_ARR = np.asarray(POINTS_EAR_GAUCHE, dtype=np.intp)
+POINTS_MAR_ARR = np.asarray(POINTS_MAR, dtype=np.intp)
 
-# ============================================================================
-# HELPER FUNCTIONS (from main_combined_raspberrypi4.py)
-# ============================================================================
+# Point pairs (indices into the EAR / MAR point arrays) whose distances are needed
+EAR_PAIRS = np.asarray([[1, 5], [2, 4], [0, 3]], dtype=np.intp)
+MAR_PAIRS = np.asarray([[2, 10], [3, 9], [4, 8], [5, 7], [0, 6]], dtype=np.intp)
 
-def obtenir_points(landmarks, indices, largeur, hauteur):
-    """Convert landmarks to pixel coordinates"""
-    points = []
-    for i in indices:
-        x = int(landmarks[i].x * largeur)
-        y = int(landmarks[i].y * hauteur)
-        points.append([x, y])
-    return np.array(points)
+# All 11 distance pairs as indices into the full landmark array (right eye, left eye, mouth)
+ALL_PAIRS = np.ascontiguousarray(np.concatenate([
+    POINTS_EAR_DROIT_ARR[EAR_PAIRS],
+    POINTS_EAR_GAUCHE_ARR[EAR_PAIRS],
+    POINTS_MAR_ARR[MAR_PAIRS]
+]))
 
 
-def calculer_ear(points):
-    """Calculate Eye Aspect Ratio"""
-    A = distance.euclidean(points[1], points[5])
-    B = distance.euclidean(points[2], points[4])
-    C = distance.euclidean(points[0], points[3])
-    ear = (A + B) / (2.0 * C)
-    return ear
+# Detection result when no face is found
+EMPTY_RESULT = {
+    'face_detected': False,
+    'ear_right': 0.0,
+    'ear_left': 0.0,
+    'ear_avg': 0.0,
+    'mar': 0.0,
+    'eyes_closed': False,
+    'yawning': False
+}
 
 
-def calculer_mar(points):
-    """Calculate Mouth Aspect Ratio"""
-    A = distance.euclidean(points[2], points[10])
-    B = distance.euclidean(points[3], points[9])
-    C = distance.euclidean(points[4], points[8])
-    D = distance.euclidean(points[5], points[7])
-    E = distance.euclidean(points[0], points[6])
-    mar = (A + B + C + D) / (4.0 * E)
-    return mar
+# ============================================================================
+# HELPER FUNCTIONS (from main_combined_raspberrypi4.py)
+# ============================================================================
+
+def landmarks_to_array(landmarks, largeur, hauteur):
+    """Convert all landmarks to a (N, 2) float32 array of pixel coordinates"""
+    pts = np.fromiter(
+        (v for lm in landmarks for v in (lm.x, lm.y)),
+        dtype=np.float32,
+        count=len(landmarks) * 2
+    ).reshape(-1, 2)
+    pts *= (largeur, hauteur)
+    return pts
 
 
 # ============================================================================
@@ -79,26 +89,64 @@ class DrowsinessDetector:
     Uses MediaPipe Face Mesh for real-time detection
     """
     
-    def __init__(self):
-        """Initialize MediaPipe Face Mesh"""
+    def __init__(self, model_path="face_landmarker.task"):
+        """Initialize MediaPipe FaceLandmarker on GPU if available, else legacy Face Mesh (CPU)"""
         self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.3,  # Lower threshold for better detection
-            min_tracking_confidence=0.3    # Lower threshold for better detection
-        )
+        self.face_mesh = None
+        self.landmarker = self._create_gpu_landmarker(model_path)
+        
+        if self.landmarker is None:
+            self.face_mesh = self.mp_face_mesh.FaceMesh(
+                max_num_faces=1,
+                refine_landmarks=True,
+                min_detection_confidence=0.3,  # Lower threshold for better detection
+                min_tracking_confidence=0.3    # Lower threshold for better detection
+            )
+        # Result dict reused by every detect() call
+        self._result = dict(EMPTY_RESULT)
+        # MediaPipe input width, height follows the frame's aspect ratio
+        # (landmarks are normalized and mapped back with the original size)
+        self.input_width = 320
+        # Reused RGB buffer (MediaPipe needs a contiguous array)
+        self._rgb_buf = None
         print("✅ DrowsinessDetector initialized (detection confidence: 0.3)")
     
-    def detect(self, frame):
+    def _create_gpu_landmarker(self, model_path):
+        """Create a tasks-vision FaceLandmarker with the GPU delegate (None if unavailable)"""
+        if not os.path.exists(model_path):
+            return None
+        
+        try:
+            from mediapipe.tasks.python import BaseOptions, vision
+            options = vision.FaceLandmarkerOptions(
+                base_options=BaseOptions(
+                    model_asset_path=model_path,
+                    delegate=BaseOptions.Delegate.GPU
+                ),
+                running_mode=vision.RunningMode.IMAGE,
+                num_faces=1,
+                min_face_detection_confidence=0.3,
+                min_face_presence_confidence=0.3,
+                min_tracking_confidence=0.3
+            )
+            landmarker = vision.FaceLandmarker.create_from_options(options)
+            print("✅ FaceLandmarker running on GPU")
+            return landmarker
+        except Exception as e:
+            print(f"ℹ️  GPU FaceLandmarker unavailable, using CPU Face Mesh: {e}")
+            return None
+    
+    def detect(self, frame, ear_threshold=None, mar_threshold=None):
         """
         Detect drowsiness from a single frame
         
         Args:
             frame: BGR image from OpenCV
+            ear_threshold: Eye Aspect Ratio threshold (None = don't check eyes)
+            mar_threshold: Mouth Aspect Ratio threshold (None = don't check yawning)
             
         Returns:
-            dict with detection results:
+            dict with detection results (reused between calls, copy it to keep it):
             {
                 'face_detected': bool,
                 'ear_right': float,
@@ -109,79 +157,75 @@ class DrowsinessDetector:
                 'yawning': bool
             }
         """
-        result = {
-            'face_detected': False,
-            'ear_right': 0.0,
-            'ear_left': 0.0,
-            'ear_avg': 0.0,
-            'mar': 0.0,
-            'eyes_closed': False,
-            'yawning': False
-        }
-        
-        if frame is None:
-            return result
-        
-        # Get frame dimensions
-        hauteur, largeur, _ = frame.shape
-        
-        # Convert BGR to RGB for MediaPipe
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Process with MediaPipe
-        results = self.face_mesh.process(rgb)
+        # Reuse the same dict every frame (reset in place)
+        result = self._result
+        result.update(EMPTY_RESULT)
         
-        if not results.multi_face_landmarks:
+        pts = self._find_landmarks(frame)
+        if pts is None:
             return result
         
-        # Get first face
-        face_landmarks = results.multi_face_landmarks[0]
-        landmarks = face_landmarks.landmark
-        
         result['face_detected'] = True
         
-        # Calculate EAR for both eyes
-        pts_ear_droit = obtenir_points(landmarks, POINTS_EAR_DROIT, largeur, hauteur)
-        pts_ear_gauche = obtenir_points(landmarks, POINTS_EAR_GAUCHE, largeur, hauteur)
-        
-        result['ear_right'] = calculer_ear(pts_ear_droit)
-        result['ear_left'] = calculer_ear(pts_ear_gauche)
-        result['ear_avg'] = (result['ear_right'] + result['ear_left']) / 2.0
-        
-        # Calculate MAR for mouth
-        pts_mar = obtenir_points(landmarks, POINTS_MAR, largeur, hauteur)
-        result['mar'] = calculer_mar(pts_mar)
+        # Ratios and threshold checks in one compiled call (missing thresholds never trip)
+        ear_right, ear_left, mar, eyes_closed, yawning = analyze(
+            pts, ALL_PAIRS,
+            -1.0 if ear_threshold is None else ear_threshold,
+            np.inf if mar_threshold is None else mar_threshold
+        )
+        result['ear_right'] = ear_right
+        result['ear_left'] = ear_left
+        result['ear_avg'] = (ear_right + ear_left) / 2.0
+        result['mar'] = mar
+        result['eyes_closed'] = eyes_closed
+        result['yawning'] = yawning
         
         return result
     
     def analyze_with_thresholds(self, frame, ear_threshold=0.25, mar_threshold=0.6):
-        """
-        Detect drowsiness with custom thresholds
+        """Detect drowsiness with custom thresholds (alias of detect with thresholds)"""
+        return self.detect(frame, ear_threshold, mar_threshold)
+    
+    def _find_landmarks(self, frame):
+        """Run Face Mesh on a BGR frame, return the (N, 2) pixel landmark array or None"""
+        if frame is None:
+            return None
         
-        Args:
-            frame: BGR image from OpenCV
-            ear_threshold: Eye Aspect Ratio threshold (default 0.25)
-            mar_threshold: Mouth Aspect Ratio threshold (default 0.6)
-            
-        Returns:
-            dict with detection results including alert status
-        """
-        result = self.detect(frame)
+        # Get frame dimensions
+        hauteur, largeur, _ = frame.shape
         
-        if result['face_detected']:
-            # Check if eyes are closed
-            result['eyes_closed'] = (
-                result['ear_right'] < ear_threshold and 
-                result['ear_left'] < ear_threshold
-            )
-            
-            # Check if yawning
-            result['yawning'] = result['mar'] > mar_threshold
+        # Downscale before inference (landmarks are mapped back with the original size)
+        small = frame
+        if largeur > self.input_width:
+            taille = (self.input_width, round(hauteur * self.input_width / largeur))
+            small = cv2.resize(frame, taille, interpolation=cv2.INTER_LINEAR)
         
-        return result
+        # Convert BGR to RGB for MediaPipe into a persistent buffer (no per-frame allocation)
+        if self._rgb_buf is None or self._rgb_buf.shape != small.shape:
+            self._rgb_buf = np.empty_like(small)
+        np.copyto(self._rgb_buf, small[:, :, ::-1])
+        
+        # Process with MediaPipe (NumPy copy and MediaPipe inference both release the GIL)
+        if self.landmarker is not None:
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=self._rgb_buf)
+            faces = self.landmarker.detect(image).face_landmarks
+            if not faces:
+                return None
+            landmarks = faces[0]
+        else:
+            results = self.face_mesh.process(self._rgb_buf)
+            if not results.multi_face_landmarks:
+                return None
+            landmarks = results.multi_face_landmarks[0].landmark
+        
+        # Convert all landmarks of the first face to pixel coordinates once
+        return landmarks_to_array(landmarks, largeur, hauteur)
     
     def close(self):
         """Close MediaPipe resources"""
+        if self.landmarker:
+            self.landmarker.close()
+            print("✅ DrowsinessDetector closed")
         if self.face_mesh:
             self.face_mesh.close()
             print("✅ DrowsinessDetector closed")
@@ -3,23 +3,137 @@ Emotion Detection Module
 Detects emotions from faces using DeepFace (runs in thread)
 Shared across continuous_detector.py and main_combined.py
 """
+import os
 import time
-from deepface import DeepFace
+import threading
+from collections import namedtuple
+import cv2
+import numpy as np
 
 
 # Emotion detection interval (analyze every 10 seconds)
 EMOTION_INTERVAL = 10.0
 
+# Quantized emotion model written by export_emotion_onnx.py (DeepFace's Keras model is used when missing)
+EMOTION_ONNX_PATH = "emotion_int8.onnx"
+
+# Output order of DeepFace's emotion model
+EMOTION_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+
+# Face detector for the ONNX path (same Haar cascade and parameters as DeepFace's "opencv" backend)
+FACE_CASCADE_PATH = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+
+
+# Immutable published result: dominant emotion, scores dict (never mutated once published),
+# and the (emotion, score) pairs ranked by score
+EmotionSnapshot = namedtuple("EmotionSnapshot", ["emotion", "scores", "ranked"])
+
 
 class EmotionDetector:
     """Detects emotions from faces using DeepFace (runs in thread)"""
     
     def __init__(self, enabled=True):
-        self.current_emotion = None
-        self.emotion_scores = {'happy': 0, 'sad': 0, 'neutral': 0}
-        self.last_analysis_time = 0
+        # Latest result, swapped in as one reference by the worker: readers take it once
+        # per frame and never see a half-updated result
+        scores = {'happy': 0, 'sad': 0, 'neutral': 0}
+        self.snapshot = EmotionSnapshot(None, scores, tuple(scores.items()))
+        self.last_analysis_time = -EMOTION_INTERVAL  # monotonic clock, analyze right away
         self.is_analyzing = False
         self.enabled = enabled
+        
+        # Single persistent worker thread fed through a 1-slot job box
+        self._job = None
+        self._emotion_model = None
+        # ONNX Runtime session, set by _load_model() when the INT8 model has been exported
+        self._onnx_session = None
+        self._onnx_input = None
+        self._face_cascade = None
+        # DeepFace (and TensorFlow) are only imported on first use, and never when the ONNX model is loaded
+        self._DeepFace = None
+        self._job_cond = threading.Condition()
+        self._worker = threading.Thread(target=self._worker_loop, daemon=True)
+        self._worker.start()
+    
+    def submit(self, frame):
+        """Hand a frame to the worker thread (the caller must not modify it afterwards)"""
+        with self._job_cond:
+            self.is_analyzing = True
+            self._job = frame
+            self._job_cond.notify()
+    
+    def _worker_loop(self):
+        """Wait for submitted frames and analyze them one at a time"""
+        model_loaded = False
+        while True:
+            with self._job_cond:
+                while self._job is None:
+                    self._job_cond.wait()
+                frame = self._job
+                self._job = None
+            
+            # Model only loaded once the first frame is submitted (TensorFlow only without the ONNX file)
+            if self.enabled and not model_loaded:
+                self._load_model()
+                model_loaded = True
+            self.analyze_frame(frame)
+    
+    def _get_deepface(self):
+        """Import DeepFace on first use"""
+        if self._DeepFace is None:
+            from deepface import DeepFace
+            self._DeepFace = DeepFace
+        return self._DeepFace
+    
+    def _load_model(self):
+        """Load the INT8 ONNX emotion model if exported, else build the DeepFace one (cached by DeepFace)"""
+        if os.path.exists(EMOTION_ONNX_PATH):
+            try:
+                import onnxruntime as ort
+                self._onnx_session = ort.InferenceSession(EMOTION_ONNX_PATH, providers=["CPUExecutionProvider"])
+                self._onnx_input = self._onnx_session.get_inputs()[0].name
+                self._face_cascade = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+                print("✅ Emotion model loaded (ONNX Runtime, INT8)")
+                return
+            except Exception as e:
+                print(f"⚠️  ONNX emotion model unavailable, using DeepFace: {e}")
+        
+        try:
+            self._emotion_model = self._get_deepface().build_model("Emotion", task="facial_attribute")
+            print("✅ Emotion model loaded")
+        except Exception as e:
+            print(f"⚠️  Emotion model preload failed: {e}")
+    
+    def _predict_onnx(self, frame):
+        """Emotion percentages from the ONNX model (OpenCV finds the face, DeepFace is never imported)"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self._face_cascade.detectMultiScale(gray, 1.1, 10)
+        if len(faces):
+            # Largest face, like enforce_detection=False the whole frame is used when none is found
+            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            gray = gray[y:y + h, x:x + w]
+        
+        # DeepFace emotion client input: 48x48 grayscale in [0, 1]
+        face = cv2.resize(gray, (48, 48)).astype(np.float32) / 255.0
+        probs = self._onnx_session.run(None, {self._onnx_input: face[None, :, :, None]})[0][0]
+        return self._to_percentages(probs)
+    
+    def _predict_keras(self, frame):
+        """Emotion percentages from the preloaded Keras model (DeepFace finds the face)"""
+        faces = self._get_deepface().extract_faces(frame, detector_backend="opencv", enforce_detection=False)
+        if not faces:
+            return None
+        
+        # DeepFace emotion client input: 48x48 grayscale in [0, 1]
+        face = np.asarray(faces[0]["face"], dtype=np.float32)
+        gray = cv2.resize(cv2.cvtColor(face, cv2.COLOR_RGB2GRAY), (48, 48))[None, :, :, None]
+        probs = self._emotion_model.model.predict(gray, verbose=0)[0]
+        return self._to_percentages(probs)
+    
+    @staticmethod
+    def _to_percentages(probs):
+        """Map the model's 7 output probabilities to {label: percentage}"""
+        probs = 100 * probs / probs.sum()
+        return dict(zip(EMOTION_LABELS, probs.tolist()))
     
     def analyze_frame(self, frame):
         """Analyze frame for emotions (runs in thread)"""
@@ -28,43 +142,50 @@ class EmotionDetector:
         
         try:
             self.is_analyzing = True
-            result = DeepFace.analyze(frame, actions=['emotion'], 
-                                     enforce_detection=False, silent=True)
+            if self._onnx_session is not None:
+                all_emotions = self._predict_onnx(frame)
+            elif self._emotion_model is not None:
+                all_emotions = self._predict_keras(frame)
+            else:
+                result = self._get_deepface().analyze(frame, actions=['emotion'], 
+                                                      enforce_detection=False, silent=True)
+                all_emotions = result[0]['emotion'] if isinstance(result, list) and len(result) > 0 else None
             
-            if isinstance(result, list) and len(result) > 0:
-                result = result[0]
-                
-                # Get all emotions from DeepFace
-                all_emotions = result['emotion']
-                
-                # Map to our 3 emotions
-                self.emotion_scores['happy'] = all_emotions.get('happy', 0)
-                self.emotion_scores['sad'] = all_emotions.get('sad', 0)
-                self.emotion_scores['neutral'] = (
-                    all_emotions.get('neutral', 0) + 
-                    all_emotions.get('surprise', 0)
-                ) / 2
+            if all_emotions:
+                # Map to our 3 emotions (built locally, then published in one swap)
+                scores = {
+                    'happy': all_emotions.get('happy', 0),
+                    'sad': all_emotions.get('sad', 0),
+                    'neutral': (all_emotions.get('neutral', 0) + all_emotions.get('surprise', 0)) / 2
+                }
                 
                 # Get dominant emotion from our 3
-                self.current_emotion = max(self.emotion_scores, key=self.emotion_scores.get)
+                emotion = max(scores, key=scores.get)
+                ranked = tuple(sorted(scores.items(), key=lambda x: x[1], reverse=True))
+                
+                self.snapshot = EmotionSnapshot(emotion, scores, ranked)
                 
-                print(f"✅ Emotion: {self.current_emotion.upper()} ({self.emotion_scores[self.current_emotion]:.1f}%)")
-                print(f"   Happy: {self.emotion_scores['happy']:.1f}% | Sad: {self.emotion_scores['sad']:.1f}% | Neutral: {self.emotion_scores['neutral']:.1f}%")
+                print(f"✅ Emotion: {emotion.upper()} ({scores[emotion]:.1f}%)")
+                print(f"   Happy: {scores['happy']:.1f}% | Sad: {scores['sad']:.1f}% | Neutral: {scores['neutral']:.1f}%")
             
         except Exception as e:
             print(f"⚠️  Emotion detection error: {e}")
         
         finally:
             self.is_analyzing = False
-            self.last_analysis_time = time.time()
+            self.last_analysis_time = time.monotonic()
     
-    def should_analyze(self):
-        """Check if it's time to analyze"""
+    def should_analyze(self, now=None):
+        """Check if it's time to analyze (now: the caller's cached time.monotonic())"""
         if not self.enabled:
             return False
-        return (time.time() - self.last_analysis_time) >= EMOTION_INTERVAL and not self.is_analyzing
+        if now is None:
+            now = time.monotonic()
+        return (now - self.last_analysis_time) >= EMOTION_INTERVAL and not self.is_analyzing
     
-    def get_time_until_next(self):
-        """Get time until next analysis"""
-        elapsed = time.time() - self.last_analysis_time
+    def get_time_until_next(self, now=None):
+        """Get time until next analysis (now: the caller's cached time.monotonic())"""
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self.last_analysis_time
         return max(0, EMOTION_INTERVAL - elapsed)
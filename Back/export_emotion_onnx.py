@@ -0,0 +1,38 @@
+"""
+One-time export of DeepFace's emotion model to a quantized INT8 ONNX file
+EmotionDetector picks it up automatically (runs it with ONNX Runtime on CPU)
+
+Usage:
+    pip install tf2onnx onnxruntime
+    python export_emotion_onnx.py
+"""
+import os
+import tensorflow as tf
+import tf2onnx
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from deepface import DeepFace
+
+from emotion_detector import EMOTION_ONNX_PATH
+
+# Intermediate full-precision export (deleted once quantized)
+FP32_PATH = "emotion_fp32.onnx"
+
+
+def main():
+    print("📦 Building DeepFace emotion model...")
+    model = DeepFace.build_model("Emotion", task="facial_attribute").model
+    
+    print("🔄 Converting to ONNX...")
+    spec = (tf.TensorSpec((None, 48, 48, 1), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=FP32_PATH)
+    
+    print("🔢 Quantizing weights to INT8...")
+    quantize_dynamic(FP32_PATH, EMOTION_ONNX_PATH, weight_type=QuantType.QInt8)
+    os.remove(FP32_PATH)
+    
+    size_kb = os.path.getsize(EMOTION_ONNX_PATH) / 1024
+    print(f"✅ Saved {EMOTION_ONNX_PATH} ({size_kb:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
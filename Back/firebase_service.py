@@ -4,9 +4,90 @@ Sends detection data, alerts, and statistics to Firebase Realtime Database
 """
 import firebase_admin
 from firebase_admin import credentials, db
-from datetime import datetime
 import json
+import logging
+import random
+import socket
+import threading
+import time
 from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from timestamps import now_iso
+
+
+logger = logging.getLogger("drowsy.firebase")
+
+# Batched writes: flush every 500 ms or as soon as 50 writes are pending
+FLUSH_INTERVAL = 0.5
+FLUSH_MAX_ENTRIES = 50
+
+# Failed flushes are retried with exponential backoff (0.5 s doubling up to 8 s); while
+# Firebase is unreachable at most 1000 writes are kept, the oldest pushes are dropped first
+FLUSH_RETRY_MAX = 8.0
+MAX_PENDING_WRITES = 1000
+
+# Statistics are written at most once every 2 seconds (latest values win)
+STATS_MIN_INTERVAL = 2.0
+
+# TCP keep-alive on Firebase connections, so idle periods don't cost a new TLS handshake
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux only (Raspberry Pi)
+    KEEPALIVE_SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    ]
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections use TCP keep-alive"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Firebase push-ID alphabet (lexicographically ordered)
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_push_id_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = [0] * 12
+
+
+def _generate_push_id() -> str:
+    """
+    Generate a Firebase push ID locally (8 chars of ms timestamp + 12 random chars)
+    IDs are chronologically sortable, same algorithm as the Firebase client SDKs
+    """
+    global _last_push_time
+    
+    with _push_id_lock:
+        now = int(time.time() * 1000)
+        duplicate_time = now == _last_push_time
+        _last_push_time = now
+        
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        time_chars.reverse()
+        
+        if not duplicate_time:
+            for i in range(12):
+                _last_rand_chars[i] = random.randrange(64)
+        else:
+            # Same millisecond: increment the random part so IDs stay unique and ordered
+            i = 11
+            while i >= 0 and _last_rand_chars[i] == 63:
+                _last_rand_chars[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_rand_chars[i] += 1
+        
+        return ''.join(time_chars) + ''.join(PUSH_CHARS[c] for c in _last_rand_chars)
 
 
 class FirebaseService:
@@ -22,6 +103,20 @@ class FirebaseService:
         """
         self.initialized = False
         
+        # Pending multi-location writes (path -> data), flushed in a single update()
+        self._pending_writes = {}
+        self._pending_lock = threading.Lock()
+        self._flush_timer = None
+        self._flush_delay = FLUSH_INTERVAL  # grows while flushes fail
+        
+        # Cached db.reference objects (path -> Reference)
+        self._refs = {}
+        
+        # Debounced statistics (user_id -> latest stats)
+        self._pending_stats = {}
+        self._stats_timer = None
+        self._last_stats_flush = 0.0
+        
         try:
             # Check if Firebase is already initialized
             if not firebase_admin._apps:
@@ -35,16 +130,32 @@ class FirebaseService:
                 else:
                     firebase_admin.initialize_app(cred)
                 
-                print("✅ Firebase initialized successfully")
+                logger.info("✅ Firebase initialized successfully")
             else:
-                print("ℹ️  Firebase already initialized")
+                logger.info("ℹ️  Firebase already initialized")
             
             self.initialized = True
             
+            if database_url:
+                self._tune_http_session()
+            
         except Exception as e:
-            print(f"❌ Firebase initialization error: {e}")
+            logger.error("❌ Firebase initialization error: %s", e)
             self.initialized = False
     
+    def _tune_http_session(self):
+        """
+        Replace the database client's HTTPS adapter with a small keep-alive pool
+        Uses firebase_admin's internal client session (checked against firebase-admin 6.7.0)
+        """
+        try:
+            session = self._ref('/')._client.session
+            retries = session.get_adapter('https://').max_retries  # keep firebase_admin's retry policy
+            session.mount('https://', KeepAliveAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+            logger.info("✅ Firebase HTTP keep-alive pool configured")
+        except Exception as e:
+            logger.warning("⚠️  Could not configure Firebase keep-alive pool: %s", e)
+    
     def send_detection_data(self, detection_result: Dict, user_id: str = "default_user") -> bool:
         """
         Send detection result to Firebase
@@ -57,25 +168,96 @@ class FirebaseService:
             True if successful, False otherwise
         """
         if not self.initialized:
-            print("⚠️  Firebase not initialized, skipping data send")
+            logger.warning("⚠️  Firebase not initialized, skipping data send")
             return False
         
         try:
-            # Create reference to user's detections
-            ref = db.reference(f'users/{user_id}/detections')
-            
             # Add timestamp if not present
             if 'timestamp' not in detection_result:
-                detection_result['timestamp'] = datetime.now().isoformat()
+                detection_result['timestamp'] = now_iso()
             
-            # Push new detection data
-            new_ref = ref.push(detection_result)
-            print(f"🔥 Detection data sent to Firebase → users/{user_id}/detections/{new_ref.key}")
+            # Queue new detection data under a locally generated push ID
+            key = _generate_push_id()
+            self._queue_write(f'users/{user_id}/detections/{key}', detection_result)
+            logger.debug("🔥 Detection data queued for Firebase → users/%s/detections/%s", user_id, key)
             
             return True
             
         except Exception as e:
-            print(f"❌ Error sending detection data: {e}")
+            logger.error("❌ Error sending detection data: %s", e)
+            return False
+    
+    def _ref(self, path: str):
+        """Get a (cached) database reference for a path"""
+        ref = self._refs.get(path)
+        if ref is None:
+            ref = self._refs[path] = db.reference(path)
+        return ref
+    
+    def _queue_write(self, path: str, data: Dict):
+        """Add a write to the pending batch and schedule a flush"""
+        with self._pending_lock:
+            self._pending_writes[path] = data
+            self._trim_pending()
+            # While backing off after a failure, the retry timer sends the batch
+            batch_full = len(self._pending_writes) >= FLUSH_MAX_ENTRIES and self._flush_delay == FLUSH_INTERVAL
+            if not batch_full:
+                self._arm_flush_timer()
+        
+        if batch_full:
+            self.flush()
+    
+    def _arm_flush_timer(self):
+        """Schedule a flush (after the current retry delay) if none is pending (caller holds _pending_lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self._flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def _trim_pending(self):
+        """Drop the oldest pushes beyond MAX_PENDING_WRITES, stats are kept (caller holds _pending_lock)"""
+        excess = len(self._pending_writes) - MAX_PENDING_WRITES
+        if excess <= 0:
+            return
+        
+        oldest = [path for path in self._pending_writes if not path.endswith('/stats')][:excess]
+        for path in oldest:
+            del self._pending_writes[path]
+        logger.warning("⚠️  Firebase unreachable, dropped %d oldest pending write(s)", len(oldest))
+    
+    def flush(self) -> bool:
+        """
+        Send all pending writes to Firebase in one multi-location update
+        
+        Returns:
+            True if successful (or nothing to send), False otherwise
+        """
+        with self._pending_lock:
+            pending = self._pending_writes
+            self._pending_writes = {}
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        
+        if not pending:
+            return True
+        
+        try:
+            self._ref('/').update(pending)
+            self._flush_delay = FLUSH_INTERVAL
+            logger.debug("🔥 Flushed %d write(s) to Firebase", len(pending))
+            return True
+            
+        except Exception as e:
+            # Put the batch back (newer writes to the same path win) and retry with backoff
+            with self._pending_lock:
+                pending.update(self._pending_writes)
+                self._pending_writes = pending
+                self._trim_pending()
+                self._flush_delay = min(self._flush_delay * 2, FLUSH_RETRY_MAX)
+                self._arm_flush_timer()
+                kept, delay = len(pending), self._flush_delay
+            logger.error("❌ Error flushing Firebase writes (%d kept, retry in %.1fs): %s", kept, delay, e)
             return False
     
     def send_alert(self, alert_type: str, alert_data: Dict, user_id: str = "default_user") -> bool:
@@ -91,26 +273,24 @@ class FirebaseService:
             True if successful, False otherwise
         """
         if not self.initialized:
-            print("⚠️  Firebase not initialized, skipping alert send")
+            logger.warning("⚠️  Firebase not initialized, skipping alert send")
             return False
         
         try:
-            # Create reference to user's alerts
-            ref = db.reference(f'users/{user_id}/alerts')
-            
             # Add alert type and timestamp to the data
             alert_data['type'] = alert_type
             if 'timestamp' not in alert_data:
-                alert_data['timestamp'] = datetime.now().isoformat()
+                alert_data['timestamp'] = now_iso()
             
-            # Push alert directly (flat structure)
-            new_ref = ref.push(alert_data)
+            # Queue alert under a locally generated push ID (flat structure)
+            key = _generate_push_id()
+            self._queue_write(f'users/{user_id}/alerts/{key}', alert_data)
             
-            print(f"🔔 Alert sent to Firebase: {alert_type} → users/{user_id}/alerts/{new_ref.key}")
+            logger.debug("🔔 Alert queued for Firebase: %s → users/%s/alerts/%s", alert_type, user_id, key)
             return True
             
         except Exception as e:
-            print(f"❌ Error sending alert: {e}")
+            logger.error("❌ Error sending alert: %s", e)
             return False
     
     def update_statistics(self, stats: Dict, user_id: str = "default_user") -> bool:
@@ -125,23 +305,46 @@ class FirebaseService:
             True if successful, False otherwise
         """
         if not self.initialized:
-            print("⚠️  Firebase not initialized, skipping stats update")
+            logger.warning("⚠️  Firebase not initialized, skipping stats update")
             return False
         
-        try:
-            # Add last updated timestamp
-            stats['last_updated'] = datetime.now().isoformat()
-            
-            # Update stats in Realtime Database
-            ref = db.reference(f'users/{user_id}/stats')
-            ref.set(stats)
-            print(f"📊 Statistics updated in Firebase → users/{user_id}/stats")
-            
+        # Only keep the latest stats, they are written by a debounced flush
+        with self._pending_lock:
+            self._pending_stats[user_id] = stats
+            if self._stats_timer is None:
+                elapsed = time.monotonic() - self._last_stats_flush
+                self._stats_timer = threading.Timer(max(0.0, STATS_MIN_INTERVAL - elapsed), self.flush_statistics)
+                self._stats_timer.daemon = True
+                self._stats_timer.start()
+        
+        return True
+    
+    def flush_statistics(self) -> bool:
+        """
+        Write the latest pending statistics to Firebase
+        
+        Returns:
+            True if successful (or nothing to send), False otherwise
+        """
+        with self._pending_lock:
+            pending = self._pending_stats
+            self._pending_stats = {}
+            if self._stats_timer is not None:
+                self._stats_timer.cancel()
+                self._stats_timer = None
+            self._last_stats_flush = time.monotonic()
+        
+        if not pending:
             return True
-            
-        except Exception as e:
-            print(f"❌ Error updating statistics: {e}")
-            return False
+        
+        # Stamp last updated time at write time, not enqueue time
+        now = now_iso()
+        for user_id, stats in pending.items():
+            stats['last_updated'] = now
+            self._queue_write(f'users/{user_id}/stats', stats)
+            logger.debug("📊 Statistics updated in Firebase → users/%s/stats", user_id)
+        
+        return self.flush()
     
     def send_session_data(self, session_data: Dict, user_id: str = "default_user") -> Optional[str]:
         """
@@ -155,24 +358,23 @@ class FirebaseService:
             Session ID if successful, None otherwise
         """
         if not self.initialized:
-            print("⚠️  Firebase not initialized, skipping session creation")
+            logger.warning("⚠️  Firebase not initialized, skipping session creation")
             return None
         
         try:
             # Add timestamp
-            session_data['created_at'] = datetime.now().isoformat()
+            session_data['created_at'] = now_iso()
             session_data['active'] = True
             
-            # Add new session to Realtime Database
-            ref = db.reference(f'users/{user_id}/sessions')
-            new_session_ref = ref.push(session_data)
-            session_id = new_session_ref.key
+            # Add new session under a locally generated push ID (no server round-trip for the key)
+            session_id = _generate_push_id()
+            self._queue_write(f'users/{user_id}/sessions/{session_id}', session_data)
             
-            print(f"📊 New session created: {session_id} → users/{user_id}/sessions/{session_id}")
+            logger.info("📊 New session created: %s → users/%s/sessions/%s", session_id, user_id, session_id)
             return session_id
             
         except Exception as e:
-            print(f"❌ Error creating session: {e}")
+            logger.error("❌ Error creating session: %s", e)
             return None
     
     def end_session(self, session_id: str, user_id: str = "default_user") -> bool:
@@ -190,17 +392,20 @@ class FirebaseService:
             return False
         
         try:
-            ref = db.reference(f'users/{user_id}/sessions/{session_id}')
+            # The session may still be in the pending batch: write it first
+            self.flush()
+            
+            ref = self._ref(f'users/{user_id}/sessions/{session_id}')
             ref.update({
                 'active': False,
-                'ended_at': datetime.now().isoformat()
+                'ended_at': now_iso()
             })
             
-            print(f"📊 Session ended: {session_id}")
+            logger.info("📊 Session ended: %s", session_id)
             return True
             
         except Exception as e:
-            print(f"❌ Error ending session: {e}")
+            logger.error("❌ Error ending session: %s", e)
             return False
     
     def get_user_stats(self, user_id: str = "default_user") -> Optional[Dict]:
@@ -217,10 +422,10 @@ class FirebaseService:
             return None
         
         try:
-            ref = db.reference(f'users/{user_id}/stats')
+            ref = self._ref(f'users/{user_id}/stats')
             stats = ref.get()
             return stats
             
         except Exception as e:
-            print(f"❌ Error retrieving stats: {e}")
+            logger.error("❌ Error retrieving stats: %s", e)
             return None
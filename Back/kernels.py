@@ -0,0 +1,47 @@
+"""
+Numba-compiled EAR/MAR kernel
+Computes both eye ratios, the mouth ratio and the threshold decisions in one compiled call
+"""
+import math
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, fastmath=True)
+def _distances(pts, pairs, start, stop, out):
+    """Euclidean distances of landmark pairs[start:stop], written into out"""
+    for k in range(start, stop):
+        dx = pts[pairs[k, 0], 0] - pts[pairs[k, 1], 0]
+        dy = pts[pairs[k, 0], 1] - pts[pairs[k, 1], 1]
+        out[k] = math.sqrt(dx * dx + dy * dy)
+
+
+@njit(cache=True, fastmath=True)
+def compute_ratios(pts, pairs):
+    """
+    Compute the three ratios from the full (N, 2) landmark array (same pair table as analyze)
+    
+    Returns:
+        (ear_right, ear_left, mar)
+    """
+    d = np.empty(pairs.shape[0])
+    _distances(pts, pairs, 0, pairs.shape[0], d)
+    ear_right = (d[0] + d[1]) / (2.0 * d[2])
+    ear_left = (d[3] + d[4]) / (2.0 * d[5])
+    mar = (d[6] + d[7] + d[8] + d[9]) / (4.0 * d[10])
+    return ear_right, ear_left, mar
+
+
+@njit(cache=True, fastmath=True)
+def analyze(pts, pairs, ear_thr, mar_thr):
+    """
+    Compute ratios and alert decisions from the full (N, 2) landmark array
+    pairs is the (11, 2) landmark pair table: 3 right eye, 3 left eye, then 5 mouth pairs
+    
+    Returns:
+        (ear_right, ear_left, mar, eyes_closed, yawning)
+    """
+    ear_right, ear_left, mar = compute_ratios(pts, pairs)
+    eyes_closed = ear_right < ear_thr and ear_left < ear_thr
+    yawning = mar > mar_thr
+    return ear_right, ear_left, mar, eyes_closed, yawning
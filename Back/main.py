@@ -5,25 +5,36 @@ Architecture A: Continuous camera detection
 """
 from fastapi import FastAPI, HTTPException, File, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional, Set
 import time
+import logging
+import queue
+import threading
 import cv2
 import numpy as np
-from datetime import datetime
 import asyncio
+import orjson
 
 from config import Settings
 from models import HealthResponse, DetectionResult, StatsResponse, SettingsUpdate, EmotionResponse, CombinedDetectionResponse
 from detector import DrowsinessDetector
-from continuous_detector import ContinuousDetector
+from continuous_detector import ContinuousDetector, rounded_ratios
 from firebase_service import FirebaseService
+from timestamps import now_iso
 from firebase_admin import db
 
+# Logging (Firebase operations log through "drowsy.*" loggers, hot-path messages are DEBUG)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("drowsy.main")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RPi4 Drowsiness Detection API",
     description="Lightweight drowsiness detection backend for Raspberry Pi 4 with continuous camera",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Enable CORS for mobile/web access
@@ -38,16 +49,16 @@ app.add_middleware(
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
         print(f"🔌 WebSocket client connected. Total: {len(self.active_connections)}")
     
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+            self.active_connections.discard(websocket)
             print(f"🔌 WebSocket client disconnected. Total: {len(self.active_connections)}")
     
     async def broadcast(self, message: dict):
@@ -55,12 +66,19 @@ class ConnectionManager:
         if not self.active_connections:
             return
         
+        # Serialize once, then send to all clients concurrently
+        # (text frames, so browser clients can keep using JSON.parse(event.data))
+        payload = orjson.dumps(message).decode()
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
+        
         disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"❌ Error sending to client: {e}")
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                print(f"❌ Error sending to client: {result}")
                 disconnected.append(connection)
         
         # Clean up disconnected clients
@@ -79,6 +97,26 @@ stats = {
     "last_detection": None,
     "last_emotion": None
 }
+# Guards stats (written from request handlers, read from the detector thread)
+stats_lock = threading.Lock()
+
+
+def record_detection(timestamp, is_drowsy: bool, is_yawning: bool):
+    """Count one detection and its alerts in the global stats"""
+    with stats_lock:
+        stats["total_detections"] += 1
+        stats["last_detection"] = timestamp
+        stats["drowsy_alerts"] += int(is_drowsy)
+        stats["yawn_alerts"] += int(is_yawning)
+
+
+def record_emotion(emotion) -> bool:
+    """Store the latest emotion, return True if it changed"""
+    with stats_lock:
+        if emotion == stats["last_emotion"]:
+            return False
+        stats["last_emotion"] = emotion
+        return True
 
 # Initialize CONTINUOUS detector with camera (ARCHITECTURE A)
 # Use DroidCam or local camera (0)
@@ -88,51 +126,79 @@ continuous_detector = ContinuousDetector(
     mar_threshold=settings.MAR_THRESHOLD
 )
 
+# Alert level for each alert type
+ALERT_LEVELS = {"drowsiness": "danger", "yawning": "warning"}
+
+# Server event loop, captured at startup so detector-thread callbacks can schedule on it
+main_loop = None
+
 # Notification callback for WebSocket broadcasting
 def on_alert_detected(alert_data: dict):
     """Called by continuous_detector when alert detected"""
-    # Create async task to broadcast (since this is called from sync thread)
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            asyncio.create_task(manager.broadcast(alert_data))
-    except:
-        # If no event loop, create one
-        asyncio.run(manager.broadcast(alert_data))
+    # Schedule broadcast on the server's event loop (this is called from the detector thread),
+    # skipped entirely when nobody is listening
+    if main_loop is not None and manager.active_connections:
+        asyncio.run_coroutine_threadsafe(manager.broadcast(alert_data), main_loop)
     
     # Get correct alert type from the data
     alert_type = alert_data.get("alert_type", "unknown")
     
-    # Determine alert level based on type
-    if alert_type == "drowsiness":
-        alert_level = "danger"
-    elif alert_type == "yawning":
-        alert_level = "warning"
-    else:
-        alert_level = "unknown"
-    
-    # Clean alert data for Firebase
+    # Clean alert data for Firebase (continuous_detector already sends floats and strings)
     clean_alert_data = {
-        "ear": float(alert_data.get("ear_avg", 0)),
-        "mar": float(alert_data.get("mar", 0)),
-        "alert_level": alert_level,
-        "message": str(alert_data.get("message", "")),
-        "timestamp": str(alert_data.get("timestamp", "")),
-        "duration": float(alert_data.get("duration", 0))
+        "ear": alert_data.get("ear_avg", 0.0),
+        "mar": alert_data.get("mar", 0.0),
+        "alert_level": ALERT_LEVELS.get(alert_type, "unknown"),
+        "message": alert_data.get("message", ""),
+        "timestamp": alert_data.get("timestamp", ""),
+        "duration": alert_data.get("duration", 0.0)
     }
     
-    firebase.send_alert(alert_type, clean_alert_data)
+    with stats_lock:
+        stats_data = {
+            "total_detections": int(stats["total_detections"]),
+            "drowsy_alerts": int(stats["drowsy_alerts"]),
+            "yawn_alerts": int(stats["yawn_alerts"]),
+            "last_detection": str(stats["last_detection"]) if stats["last_detection"] else None
+        }
     
-    # Update stats in Firebase
-    firebase.update_statistics({
-        "total_detections": int(stats["total_detections"]),
-        "drowsy_alerts": int(stats["drowsy_alerts"]),
-        "yawn_alerts": int(stats["yawn_alerts"]),
-        "last_detection": str(stats["last_detection"]) if stats["last_detection"] else None
-    })
+    # Send alert and update stats in Firebase (in the background, detector thread doesn't wait)
+    def firebase_job():
+        firebase.send_alert(alert_type, clean_alert_data)
+        firebase.update_statistics(stats_data)
+    
+    try:
+        firebase_queue.put_nowait(firebase_job)
+    except queue.Full:
+        logger.warning("⚠️  Firebase queue full, dropping alert")
+
+# Pending "detection" broadcast: results arriving before it has been sent are skipped
+detection_push = None
+
+# Push detection results to WebSocket clients (replaces /detect/current polling)
+def on_frame_result(result: dict):
+    """Called by continuous_detector with each new detection result"""
+    global detection_push
+    if main_loop is None or not manager.active_connections:
+        return
+    if detection_push is not None and not detection_push.done():
+        return
+    
+    ratios = rounded_ratios(result)
+    message = {
+        "type": "detection",
+        "timestamp": result['timestamp'],
+        "ear": ratios['ear_avg'],
+        "mar": ratios['mar'],
+        "is_drowsy": result['eyes_closed'],
+        "is_yawning": result['yawning'],
+        "alert_level": result['alert_level'],
+        "message": result['message']
+    }
+    detection_push = asyncio.run_coroutine_threadsafe(manager.broadcast(message), main_loop)
 
-# Set callback for continuous detector
+# Set callbacks for continuous detector
 continuous_detector.set_alert_callback(on_alert_detected)
+continuous_detector.set_frame_callback(on_frame_result)
 print("🚀 Continuous detector initialized - will use Raspberry Pi camera")
 
 # Also keep single-frame detector for manual image uploads
@@ -144,10 +210,39 @@ firebase = FirebaseService(
     database_url="https://drowsy-c3d7d-default-rtdb.firebaseio.com"
 )
 
+# Background Firebase writer: Firebase network calls never block the detector thread
+firebase_queue = queue.Queue(maxsize=1000)
+
+def firebase_worker():
+    """Run queued Firebase jobs, sending each burst as one batched update (None stops the worker)"""
+    running = True
+    while running:
+        jobs = [firebase_queue.get()]
+        while True:
+            try:
+                jobs.append(firebase_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        for job in jobs:
+            if job is None:
+                running = False
+                continue
+            try:
+                job()
+            except Exception as e:
+                logger.error("❌ Firebase job error: %s", e)
+        firebase.flush()
+
+firebase_thread = threading.Thread(target=firebase_worker, daemon=True)
+firebase_thread.start()
+
 
 @app.on_event("startup")
 async def startup_event():
     """Start continuous detection when server starts"""
+    global main_loop
+    main_loop = asyncio.get_running_loop()
     continuous_detector.start()
     print("✅ Continuous camera detection started!")
     print("🔥 Firebase: Sending only ALERTS and EMOTIONS (not all detections)")
@@ -207,7 +302,7 @@ async def test_firebase():
             "mar": 0.35,
             "alert_level": "danger",
             "message": "Test drowsiness alert - Eyes closed!",
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now_iso(),
             "duration": 2.5
         }
         
@@ -219,7 +314,7 @@ async def test_firebase():
             "mar": 0.75,
             "alert_level": "warning",
             "message": "Test yawning alert - Mouth open!",
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now_iso(),
             "duration": 1.2
         }
         
@@ -229,7 +324,7 @@ async def test_firebase():
         test_emotion_data = {
             "emotion": "happy",
             "emotion_scores": {"happy": 85.5, "sad": 10.2, "neutral": 4.3},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
         
         ref = db.reference('users/default_user/emotions')
@@ -240,9 +335,18 @@ async def test_firebase():
             "total_detections": 100,
             "drowsy_alerts": 5,
             "yawn_alerts": 3,
-            "last_detection": datetime.now().isoformat()
+            "last_detection": now_iso()
         })
         
+        # Writes are batched: send them now so the result reflects the real connection
+        # (flush_statistics writes the debounced stats, then flushes the whole batch)
+        if not await asyncio.to_thread(firebase.flush_statistics):
+            return {
+                "status": "error",
+                "message": "❌ Test data could not be written to Firebase (kept for retry)",
+                "firebase_connected": False
+            }
+        
         return {
             "status": "success",
             "message": "✅ Test data sent to Firebase successfully!",
@@ -277,28 +381,45 @@ async def get_current_detection():
     result = continuous_detector.get_latest_result()
     
     # Update stats
-    stats["total_detections"] += 1
-    stats["last_detection"] = result['timestamp']
+    record_detection(result['timestamp'], result['eyes_closed'], result['yawning'])
     
-    if result['eyes_closed']:
-        stats["drowsy_alerts"] += 1
-    if result['yawning']:
-        stats["yawn_alerts"] += 1
-    
-    return DetectionResult(
-        timestamp=result['timestamp'],
-        ear=result['ear_avg'],
-        mar=result['mar'],
-        is_drowsy=result['eyes_closed'],
-        is_yawning=result['yawning'],
-        alert_level=result['alert_level'],
-        message=result['message']
-    )
+    # Return the DetectionResult fields directly (no Pydantic model round-trip)
+    return ORJSONResponse({
+        "timestamp": result['timestamp'],
+        "ear": result['ear_avg'],
+        "mar": result['mar'],
+        "is_drowsy": result['eyes_closed'],
+        "is_yawning": result['yawning'],
+        "alert_level": result['alert_level'],
+        "message": result['message']
+    })
 
 
 # ============================================================================
 # ENDPOINT 2B: Detect from Uploaded Frame (optional - for external images)
 # ============================================================================
+# Uploads wider than this are decoded at half resolution (EAR/MAR are scale-invariant)
+MAX_DECODE_WIDTH = 1280
+
+
+def jpeg_width(data) -> int:
+    """Read the image width from a JPEG's SOF header (0 if not a JPEG or not found)"""
+    if data[:2] != b'\xff\xd8':
+        return 0
+    
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return 0
+        marker = data[i + 1]
+        if marker in (0xC0, 0xC1, 0xC2):
+            # SOF: length(2) precision(1) height(2) width(2)
+            return int.from_bytes(data[i + 7:i + 9], 'big')
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    
+    return 0
+
+
 @app.post("/detect/frame", response_model=DetectionResult)
 async def detect_frame(file: UploadFile = File(...)):
     """
@@ -309,10 +430,21 @@ async def detect_frame(file: UploadFile = File(...)):
     NOTE: This is for EXTERNAL images. Use /detect/current for live camera!
     """
     try:
-        # Read uploaded image
-        contents = await file.read()
+        # Read uploaded image straight into a buffer of the right size (no intermediate bytes),
+        # in the threadpool since disk-spooled uploads would block the event loop
+        if file.size:
+            contents = bytearray(file.size)
+            await file.seek(0)
+            await run_in_threadpool(file.file.readinto, contents)
+        else:
+            contents = await file.read()
         nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        
+        # Large JPEGs are decoded directly at 1/2 scale by libjpeg (much cheaper IDCT)
+        if jpeg_width(contents) > MAX_DECODE_WIDTH:
+            frame = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_COLOR_2)
+        else:
+            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if frame is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
@@ -328,21 +460,14 @@ async def detect_frame(file: UploadFile = File(...)):
         if not detection_result['face_detected']:
             raise HTTPException(status_code=400, detail="No face detected in image")
         
-        # Update stats
-        stats["total_detections"] += 1
-        stats["last_detection"] = datetime.now().isoformat()
-        
         # Extract values
         ear_value = round(detection_result['ear_avg'], 3)
         mar_value = round(detection_result['mar'], 3)
         is_drowsy = detection_result['eyes_closed']
         is_yawning = detection_result['yawning']
         
-        # Update alert counters
-        if is_drowsy:
-            stats["drowsy_alerts"] += 1
-        if is_yawning:
-            stats["yawn_alerts"] += 1
+        # Update stats and alert counters
+        record_detection(now_iso(), is_drowsy, is_yawning)
         
         # Determine alert level and message
         if is_drowsy:
@@ -356,7 +481,7 @@ async def detect_frame(file: UploadFile = File(...)):
             message = "✅ All good - Driver is alert"
         
         return DetectionResult(
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             ear=ear_value,
             mar=mar_value,
             is_drowsy=is_drowsy,
@@ -381,13 +506,15 @@ async def get_stats():
     Returns counts of detections, alerts, and uptime
     """
     uptime_seconds = time.time() - stats["start_time"]
+    with stats_lock:
+        counts = dict(stats)
     
     return StatsResponse(
         uptime_seconds=round(uptime_seconds, 2),
-        total_detections=stats["total_detections"],
-        drowsy_alerts=stats["drowsy_alerts"],
-        yawn_alerts=stats["yawn_alerts"],
-        last_detection=stats["last_detection"],
+        total_detections=counts["total_detections"],
+        drowsy_alerts=counts["drowsy_alerts"],
+        yawn_alerts=counts["yawn_alerts"],
+        last_detection=counts["last_detection"],
         current_ear_threshold=settings.EAR_THRESHOLD,
         current_mar_threshold=settings.MAR_THRESHOLD
     )
@@ -409,11 +536,12 @@ async def get_current_emotion():
     - time_until_next: Seconds until next analysis
     """
     emotion_detector = continuous_detector.emotion_detector
+    emotion = emotion_detector.snapshot
     
     return EmotionResponse(
         timestamp=continuous_detector.latest_result['timestamp'],
-        current_emotion=emotion_detector.current_emotion,
-        emotion_scores=emotion_detector.emotion_scores.copy(),
+        current_emotion=emotion.emotion,
+        emotion_scores=dict(emotion.scores),
         is_analyzing=emotion_detector.is_analyzing,
         time_until_next=round(emotion_detector.get_time_until_next(), 1)
     )
@@ -435,18 +563,11 @@ async def get_combined_detection():
     result = continuous_detector.get_latest_result()
     
     # Update stats
-    stats["total_detections"] += 1
-    stats["last_detection"] = result['timestamp']
-    
-    if result['eyes_closed']:
-        stats["drowsy_alerts"] += 1
-    if result['yawning']:
-        stats["yawn_alerts"] += 1
+    record_detection(result['timestamp'], result['eyes_closed'], result['yawning'])
     
     # Track emotion changes and send to Firebase
     current_emotion = result.get('current_emotion')
-    if current_emotion and current_emotion != stats.get("last_emotion"):
-        stats["last_emotion"] = current_emotion
+    if current_emotion and record_emotion(current_emotion):
         # Send to users/default_user/emotions path
         ref = db.reference('users/default_user/emotions')
         ref.push({
@@ -456,17 +577,18 @@ async def get_combined_detection():
         })
         print(f"😊 Emotion changed: {current_emotion} → Firebase")
     
-    return CombinedDetectionResponse(
-        timestamp=result['timestamp'],
-        ear=result['ear_avg'],
-        mar=result['mar'],
-        is_drowsy=result['eyes_closed'],
-        is_yawning=result['yawning'],
-        alert_level=result['alert_level'],
-        message=result['message'],
-        current_emotion=result['current_emotion'],
-        emotion_scores=result['emotion_scores']
-    )
+    # Return the CombinedDetectionResponse fields directly (no Pydantic model round-trip)
+    return ORJSONResponse({
+        "timestamp": result['timestamp'],
+        "ear": result['ear_avg'],
+        "mar": result['mar'],
+        "is_drowsy": result['eyes_closed'],
+        "is_yawning": result['yawning'],
+        "alert_level": result['alert_level'],
+        "message": result['message'],
+        "current_emotion": result['current_emotion'],
+        "emotion_scores": result['emotion_scores']
+    })
 
 
 # ============================================================================
@@ -544,7 +666,7 @@ async def root():
             "emotions_current": "GET /emotions/current (emotion only)",
             "stats": "GET /stats",
             "settings": "POST /settings",
-            "websocket": "WS /ws/alerts (real-time notifications)"
+            "websocket": "WS /ws/alerts (real-time alerts + detection results)"
         }
     }
 
@@ -570,6 +692,19 @@ async def websocket_alerts(websocket: WebSocket):
         "mar": 0.7,
         "message": "Alert message"
     }
+    
+    Detection results are also pushed (no need to poll /detect/current), skipping
+    frames that arrive while the previous push is still being sent:
+    {
+        "type": "detection",
+        "timestamp": "ISO timestamp",
+        "ear": 0.28,
+        "mar": 0.35,
+        "is_drowsy": false,
+        "is_yawning": false,
+        "alert_level": "safe",
+        "message": "Status message"
+    }
     """
     await manager.connect(websocket)
     
@@ -578,7 +713,7 @@ async def websocket_alerts(websocket: WebSocket):
         await websocket.send_json({
             "type": "connected",
             "message": "Connected to drowsiness detection alerts",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         })
         
         # Keep connection alive and wait for disconnect
@@ -604,6 +739,10 @@ async def shutdown_event():
     """Cleanup on shutdown"""
     continuous_detector.stop()
     detector.close()
+    # No more alerts can be queued: let the worker drain its queue, then send what's left
+    await asyncio.to_thread(firebase_queue.put, None)
+    await asyncio.to_thread(firebase_thread.join, 10.0)
+    firebase.flush_statistics()  # also flushes the pending batch
     print("🛑 Server shutting down...")
 
 
@@ -7,11 +7,10 @@ Integrates:
 Single camera, single window!
 
 Versions:
-- opencv-python: 4.11.0.86
+- opencv-python: 4.10.0.84
 - mediapipe: 0.10.21
 - deepface: 0.0.95
-- tensorflow: 2.20.0
-- scipy: 1.16.3
+- tensorflow: 2.19.1
 
 Controls:
 - [Q] Quit
@@ -19,14 +18,18 @@ Controls:
 - [E] Toggle emotion detection on/off
 """
 
+import functools
 import cv2
 import mediapipe as mp
 import numpy as np
+import os
+import sys
 import time
 import threading
 
 # Import shared components
-from detector import POINTS_EAR_DROIT, POINTS_EAR_GAUCHE, POINTS_MAR, obtenir_points, calculer_ear, calculer_mar
+from detector import ALL_PAIRS, landmarks_to_array
+from kernels import compute_ratios
 from emotion_detector import EmotionDetector
 
 # ============================================================================
@@ -46,9 +49,32 @@ FRAMES_ALERTE_BAILLEMENT = int(DUREE_ALERTE_BAILLEMENT * FPS)
 
 COOLDOWN_ALERTE = 3.0
 
+# Camera capture backend for the local webcam
+if sys.platform.startswith("win"):
+    CAMERA_BACKEND = cv2.CAP_DSHOW
+elif sys.platform.startswith("linux"):
+    CAMERA_BACKEND = cv2.CAP_V4L2
+else:
+    CAMERA_BACKEND = cv2.CAP_ANY
+
+# MediaPipe input width, height follows the camera's aspect ratio
+# (landmarks are normalized, so they map back onto the full frame)
+LARGEUR_ANALYSE = 640
+
+# Run MediaPipe on 1 frame out of N (2 -> 12 Hz, still 24 samples per 2 s alert window);
+# alert counters still advance every displayed frame, so FRAMES_ALERTE is unchanged
+INFERENCE_TOUS_LES = 2
+
 # Emotion detection parameters
 EMOTION_ENABLED = True        # Toggle emotion detection
 
+# Alert blink rhythm, indexed by frame_count (on 5 frames, off 5 frames)
+_BLINK = (True,) * 5 + (False,) * 5
+
+# Emotion bar colors (BGR)
+EMOTION_COULEURS = {'happy': (0, 255, 0), 'sad': (0, 100, 255)}
+EMOTION_COULEUR_DEFAUT = (200, 200, 0)
+
 # ============================================================================
 # FACE MESH INDICES (for visualization only)
 # ============================================================================
@@ -73,6 +99,11 @@ INDICES_BOUCHE = [
     308, 324, 318, 402, 317, 14, 87, 178, 88, 95
 ]
 
+# Index arrays for fancy-indexing the per-frame landmark array
+_IDX_OEIL_DROIT = np.asarray(INDICES_OEIL_DROIT, dtype=np.intp)
+_IDX_OEIL_GAUCHE = np.asarray(INDICES_OEIL_GAUCHE, dtype=np.intp)
+_IDX_BOUCHE = np.asarray(INDICES_BOUCHE, dtype=np.intp)
+
 # ============================================================================
 # HELPER FUNCTIONS (visualization only - computation helpers imported from detector.py)
 # ============================================================================
@@ -85,13 +116,36 @@ def draw_text_shadow(img, text, org, font, scale, color, thickness=2, shadow_col
     cv2.putText(img, text, org, font, scale, color, thickness, cv2.LINE_AA)
 
 
-def draw_text_box(img, text, topleft, w, h, bg_color=(30,30,30,200), border_color=(100,100,100), alpha=0.75):
-    """Draw text box with background"""
-    x, y = topleft
-    overlay = img.copy()
-    cv2.rectangle(overlay, (x, y), (x + w, y + h), border_color, -1)
-    cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
-    cv2.rectangle(img, (x+4, y+4), (x + w - 4, y + h - 4), (20,20,20), -1)
+@functools.lru_cache(maxsize=256)
+def _render_text(text, font, scale, color, thickness):
+    """Rasterize a shadowed string once: (BGR sprite, mask, text origin inside the sprite)"""
+    (w, h), baseline = cv2.getTextSize(text, font, scale, thickness + 1)
+    pad = thickness + 4  # Room for the anti-aliased edge and the (2, 2) shadow
+    sprite = np.zeros((h + baseline + 2 * pad, w + 2 * pad, 3), np.uint8)
+    mask = np.zeros(sprite.shape[:2], np.uint8)
+    org = (pad, pad + h)
+    draw_text_shadow(sprite, text, org, font, scale, color, thickness=thickness)
+    draw_text_shadow(mask, text, org, font, scale, 255, thickness=thickness, shadow_color=255)
+    return sprite, mask.astype(bool)[..., None], org
+
+
+def draw_text_cached(img, text, org, font, scale, color, thickness=2):
+    """draw_text_shadow for repeated strings: rasterized once, then a masked copy"""
+    sprite, mask, (ox, oy) = _render_text(text, font, scale, color, thickness)
+    x, y = org[0] - ox, org[1] - oy
+    
+    # Clip the sprite to the image
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + sprite.shape[1], img.shape[1]), min(y + sprite.shape[0], img.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return
+    np.copyto(img[y0:y1, x0:x1], sprite[y0 - y:y1 - y, x0 - x:x1 - x], where=mask[y0 - y:y1 - y, x0 - x:x1 - x])
+
+
+def blend_rect(img, x, y, w, h, color, alpha):
+    """Blend a filled rectangle into img, touching only that region (no full-frame copy)"""
+    roi = img[y:y + h + 1, x:x + w + 1]
+    cv2.addWeighted(roi, 1 - alpha, np.full_like(roi, color), alpha, 0, dst=roi)
 
 
 def draw_progress_bar(img, topleft, length, height, progress, bg_color=(80,80,80), fg_color=(0,165,255), border=2):
@@ -104,6 +158,189 @@ def draw_progress_bar(img, topleft, length, height, progress, bg_color=(80,80,80
     cv2.rectangle(img, (x, y), (x + length, y + height), (60,60,60), 1)
 
 
+def dessiner_bordure(img, couleur, epaisseur):
+    """Paint a frame border by filling the four edge strips (slice assignment, no mask)"""
+    img[:epaisseur] = couleur
+    img[-epaisseur:] = couleur
+    img[:, :epaisseur] = couleur
+    img[:, -epaisseur:] = couleur
+
+
+def grouper_segments(style):
+    """Group mesh connections by drawing spec: [(segments (M, 2) index array, color, thickness)]"""
+    groupes = {}
+    for connexion, spec in style.items():
+        groupes.setdefault((spec.color, spec.thickness), []).append(connexion)
+    return [(np.asarray(c, dtype=np.intp), color, thickness) for (color, thickness), c in groupes.items()]
+
+
+def dessiner_mesh(img, lm, groupes):
+    """Draw mesh connections with one cv2.polylines call per drawing spec"""
+    pts = lm.astype(np.int32)
+    for segments, color, thickness in groupes:
+        cv2.polylines(img, pts[segments], False, color, thickness, cv2.LINE_8)
+
+
+def dessiner_contour_oeil(img, points, couleur, epaisseur):
+    """Draw an eye contour (the index list already closes the loop)"""
+    cv2.polylines(img, [points], False, couleur, epaisseur, cv2.LINE_AA)
+
+
+def dessiner_contour_bouche(img, points, couleur, epaisseur):
+    """Draw the mouth contour"""
+    cv2.polylines(img, [points], True, couleur, epaisseur, cv2.LINE_AA)
+
+
+# ============================================================================
+# STATIC HUD (rendered once, blitted every frame)
+# ============================================================================
+
+# Panel layout
+PANEL_X, PANEL_Y = 10, 8
+PANEL_W = 630
+PANEL_H = 280
+EAR_BOX_W, EAR_BOX_H = 260, 38
+EMOTION_PANEL_Y = 10
+EMOTION_PANEL_W, EMOTION_PANEL_H = 300, 220
+EMOTION_PANEL_MARGE = 20
+
+
+def position_panneau_emotion(largeur, hauteur):
+    """
+    Top-left corner of the emotion panel: top-right of the frame, or below the main panel
+    when the frame is too narrow for both side by side (kept inside the frame when too short)
+    """
+    x = max(0, largeur - EMOTION_PANEL_W - EMOTION_PANEL_MARGE)
+    y = EMOTION_PANEL_Y
+    if x < PANEL_X + min(PANEL_W, largeur - 20) + EMOTION_PANEL_MARGE:
+        y = max(0, min(PANEL_Y + PANEL_H + EMOTION_PANEL_MARGE, hauteur - EMOTION_PANEL_H - 1))
+    return x, y
+
+
+def build_hud(largeur, hauteur, mode_mesh, emotion_enabled):
+    """Render the static HUD chrome, returns (BGR sprite, mask of the drawn pixels)"""
+    hud_bg = np.zeros((hauteur, largeur, 3), np.uint8)
+    hud_mask = np.zeros((hauteur, largeur), np.uint8)
+    
+    # Each element is drawn on the sprite and, in white, on the mask
+    def text(txt, org, font, scale, color, thickness):
+        draw_text_shadow(hud_bg, txt, org, font, scale, color, thickness=thickness)
+        draw_text_shadow(hud_mask, txt, org, font, scale, 255, thickness=thickness, shadow_color=255)
+    
+    def rect(pt1, pt2, color, thickness):
+        cv2.rectangle(hud_bg, pt1, pt2, color, thickness)
+        cv2.rectangle(hud_mask, pt1, pt2, 255, thickness)
+    
+    def line(pt1, pt2, color):
+        cv2.line(hud_bg, pt1, pt2, color, 1)
+        cv2.line(hud_mask, pt1, pt2, 255, 1)
+    
+    panel_w = min(PANEL_W, largeur - 20)
+    
+    # Title
+    text("DROWSINESS & EMOTION DETECTOR", (PANEL_X + 14, PANEL_Y + 36), cv2.FONT_HERSHEY_DUPLEX, 0.8, (245,245,245), 2)
+    line((PANEL_X + 10, PANEL_Y + 46), (PANEL_X + panel_w - 10, PANEL_Y + 46), (90, 90, 90))
+    
+    # EAR boxes (inner part, the translucent border is blended per frame)
+    bx, by = PANEL_X + 12, PANEL_Y + 56
+    for y in (by, by + EAR_BOX_H + 6):
+        rect((bx + 4, y + 4), (bx + EAR_BOX_W - 4, y + EAR_BOX_H - 4), (20, 20, 20), -1)
+    
+    # Eye labels
+    eye_x, eye_y = PANEL_X + EAR_BOX_W + 36, PANEL_Y + 80
+    text("Droit", (eye_x + 22, eye_y + 6), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (230,230,230), 1)
+    text("Gauche", (eye_x + 22, eye_y + 42), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (230,230,230), 1)
+    
+    # Progress bars separator
+    line((PANEL_X + 10, PANEL_Y + 162), (PANEL_X + panel_w - 10, PANEL_Y + 162), (90, 90, 90))
+    
+    # Instructions
+    mode_texte = ["Tesselation", "Contours", "Points"][mode_mesh - 1]
+    text(f"Mesh: {mode_texte} [M] | Emotion [E] | Quit [Q]", (PANEL_X + 14, PANEL_Y + PANEL_H - 12),
+         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,200), 1)
+    
+    # Emotion panel frame and title
+    if emotion_enabled:
+        ex, ey = position_panneau_emotion(largeur, hauteur)
+        rect((ex, ey), (ex + EMOTION_PANEL_W, ey + EMOTION_PANEL_H), (0, 255, 100), 2)
+        text("EMOTION DETECTION", (ex + 15, ey + 30), cv2.FONT_HERSHEY_DUPLEX, 0.7, (255, 255, 255), 2)
+    
+    return hud_bg, hud_mask.astype(bool)[..., None]
+
+
+# ============================================================================
+# FACE LANDMARKS (GPU when available)
+# ============================================================================
+
+# tasks-vision FaceLandmarker model (the GPU path is skipped when the file is missing)
+MODELE_LANDMARKER = "face_landmarker.task"
+
+
+def creer_landmarker_gpu(model_path):
+    """Create a VIDEO-mode FaceLandmarker with the GPU delegate (None if unavailable)"""
+    if not os.path.exists(model_path):
+        return None
+    
+    try:
+        from mediapipe.tasks.python import BaseOptions, vision
+        options = vision.FaceLandmarkerOptions(
+            base_options=BaseOptions(
+                model_asset_path=model_path,
+                delegate=BaseOptions.Delegate.GPU
+            ),
+            running_mode=vision.RunningMode.VIDEO,
+            num_faces=1,
+            min_face_detection_confidence=0.5,
+            min_face_presence_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+        landmarker = vision.FaceLandmarker.create_from_options(options)
+        print("✅ FaceLandmarker running on GPU")
+        return landmarker
+    except Exception as e:
+        print(f"ℹ️  GPU FaceLandmarker unavailable, using CPU Face Mesh: {e}")
+        return None
+
+
+# ============================================================================
+# FRAME CAPTURE THREAD
+# ============================================================================
+
+class FrameGrabber(threading.Thread):
+    """Reads the camera in its own thread and keeps only the newest frame"""
+    
+    def __init__(self, cap):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.lock = threading.Condition()
+        self.latest = None
+        self.ret = True
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.is_set():
+            ret, f = self.cap.read()
+            with self.lock:
+                self.ret = ret
+                self.latest = f if ret else None
+                self.lock.notify()
+            if not ret:
+                break
+    
+    def read(self, timeout=1.0):
+        """Wait for a frame not yet consumed and take it, like cap.read()"""
+        with self.lock:
+            if self.latest is None and self.ret:
+                self.lock.wait(timeout)
+            frame = self.latest
+            self.latest = None
+            return frame is not None, frame
+    
+    def stop(self):
+        self.stopped.set()
+        self.join(timeout=1.0)
+
+
 # ============================================================================
 # MAIN APPLICATION
 # ============================================================================
@@ -117,10 +354,10 @@ def main():
     print("   • Emotion detection every 20 seconds")
     print("   • Complete face mesh visualization")
     print(f"\n📦 Versions:")
-    print(f"   • OpenCV: 4.11.0.86")
+    print(f"   • OpenCV: 4.10.0.84")
     print(f"   • MediaPipe: 0.10.21")
     print(f"   • DeepFace: 0.0.95")
-    print(f"   • TensorFlow: 2.20.0")
+    print(f"   • TensorFlow: 2.19.1")
     print("\n📹 Controls:")
     print("   [Q] Quit")
     print("   [M] Change mesh display mode")
@@ -130,19 +367,31 @@ def main():
     
     # Initialize MediaPipe
     mp_face_mesh = mp.solutions.face_mesh
-    mp_drawing = mp.solutions.drawing_utils
     mp_drawing_styles = mp.solutions.drawing_styles
     
-    face_mesh = mp_face_mesh.FaceMesh(
-        max_num_faces=1,
-        refine_landmarks=True,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5
-    )
+    # Mesh segments grouped by drawing spec, built once (the style getters rebuild them on every call)
+    segments_tesselation = grouper_segments(mp_drawing_styles.get_default_face_mesh_tesselation_style())
+    segments_contours = grouper_segments(mp_drawing_styles.get_default_face_mesh_contours_style())
+    
+    # GPU FaceLandmarker when available, legacy CPU Face Mesh otherwise
+    face_mesh = None
+    landmarker = creer_landmarker_gpu(MODELE_LANDMARKER)
+    dernier_timestamp_ms = -1
+    if landmarker is None:
+        face_mesh = mp_face_mesh.FaceMesh(
+            max_num_faces=1,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
     
-    # Initialize camera
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    if not cap.isOpened():
+    # Initialize camera (native backend: DirectShow on Windows, V4L2 on Linux)
+    cap = cv2.VideoCapture(0, CAMERA_BACKEND)
+    if cap.isOpened():
+        # MJPG is compressed on the webcam: ~10x less USB bandwidth than raw YUYV
+        # (set before the resolution, V4L2 picks the mode from the current format)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    else:
         cap = cv2.VideoCapture("http://192.168.1.174:4747/video")
         if not cap.isOpened():
             print("❌ Cannot open webcam")
@@ -151,6 +400,11 @@ def main():
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
     cap.set(cv2.CAP_PROP_FPS, FPS)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # No driver-side queue of stale frames
+    
+    # Capture runs in its own thread so camera I/O overlaps with inference
+    grabber = FrameGrabber(cap)
+    grabber.start()
     
     # Initialize emotion detector
     emotion_detector = EmotionDetector(enabled=EMOTION_ENABLED)
@@ -159,13 +413,31 @@ def main():
     compteur_fermeture = 0
     compteur_baillement = 0
     alerte_baillement_active = False
-    dernier_alerte_baillement = 0
+    dernier_alerte_baillement = -COOLDOWN_ALERTE
     alerte_active = False
-    dernier_alerte = 0
+    dernier_alerte = -COOLDOWN_ALERTE
     mode_mesh = 1  # 1=Tesselation, 2=Contours, 3=Points
     
     frame_count = 0
     
+    # Landmarks of the last inference, reused on skipped frames
+    visages_px = []
+    
+    # Preallocated mirror destination (sized from the first frame)
+    flip_buf = None
+    
+    # Preallocated MediaPipe input buffers (sized from the first frame, resize and
+    # color conversion write in place)
+    small_buf = rgb_small_buf = None
+    taille_analyse = None
+    
+    # Scratch frame handed to the emotion worker
+    emotion_buf = None
+    
+    # Static HUD sprite, rebuilt only when its key (size, mesh mode, emotion panel) changes
+    hud_cle = None
+    hud_bg = hud_where = None
+    
     print("✅ System ready! Starting detection...\n")
     
     # ========================================================================
@@ -173,19 +445,48 @@ def main():
     # ========================================================================
     
     while True:
-        ret, frame = cap.read()
+        ret, frame = grabber.read()
         if not ret:
+            if grabber.ret:
+                continue  # No new frame yet
             print("❌ Error reading frame")
             break
         
-        frame = cv2.flip(frame, 1)
-        hauteur, largeur, _ = frame.shape
+        # One clock read per frame (monotonic: immune to wall-clock jumps)
+        temps_actuel = time.monotonic()
         
-        # Convert to RGB for MediaPipe
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Mirror into a reused buffer (the grabber hands over a fresh array every frame)
+        if flip_buf is None or flip_buf.shape != frame.shape:
+            flip_buf = np.empty_like(frame)
+            # Analysis size keeps the frame's aspect ratio (no squashing of EAR/MAR)
+            h, w = frame.shape[:2]
+            taille_analyse = (LARGEUR_ANALYSE, round(h * LARGEUR_ANALYSE / w))
+            small_buf = np.empty((taille_analyse[1], taille_analyse[0], 3), dtype=np.uint8)
+            rgb_small_buf = np.empty_like(small_buf)
+        frame = cv2.flip(frame, 1, dst=flip_buf)
+        hauteur, largeur, _ = frame.shape
         
-        # Detect face with MediaPipe
-        results = face_mesh.process(rgb)
+        # MediaPipe runs on one frame out of INFERENCE_TOUS_LES, the others reuse its landmarks
+        if frame_count % INFERENCE_TOUS_LES == 0:
+            # Downscale, then convert to RGB for MediaPipe (4x fewer bytes than 720p)
+            cv2.resize(frame, taille_analyse, dst=small_buf, interpolation=cv2.INTER_LINEAR)
+            cv2.cvtColor(small_buf, cv2.COLOR_BGR2RGB, dst=rgb_small_buf)
+            
+            # Detect face with MediaPipe (read-only input lets it use the buffer without copying)
+            rgb_small_buf.flags.writeable = False
+            if landmarker is not None:
+                # VIDEO mode needs strictly increasing timestamps
+                timestamp_ms = max(int(temps_actuel * 1000), dernier_timestamp_ms + 1)
+                dernier_timestamp_ms = timestamp_ms
+                image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_small_buf)
+                visages = landmarker.detect_for_video(image, timestamp_ms).face_landmarks
+            else:
+                results = face_mesh.process(rgb_small_buf)
+                visages = [f.landmark for f in results.multi_face_landmarks or ()]
+            rgb_small_buf.flags.writeable = True
+            
+            # All landmarks of each face as one (N, 2) pixel array, indexed per point set below
+            visages_px = [landmarks_to_array(landmarks, largeur, hauteur) for landmarks in visages]
         
         # Variables
         ear_droit = 0
@@ -193,159 +494,139 @@ def main():
         oeil_droit_ferme = False
         oeil_gauche_ferme = False
         les_deux_yeux_fermes = False
-        temps_actuel = time.time()
         mar = 0
         baillement_detecte = False
         
-        if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
-                landmarks = face_landmarks.landmark
-                
-                # ============================================================
-                # DRAW FACE MESH
-                # ============================================================
-                if mode_mesh == 1:
-                    mp_drawing.draw_landmarks(
-                        image=frame,
-                        landmark_list=face_landmarks,
-                        connections=mp_face_mesh.FACEMESH_TESSELATION,
-                        landmark_drawing_spec=None,
-                        connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_tesselation_style()
-                    )
-                elif mode_mesh == 2:
-                    mp_drawing.draw_landmarks(
-                        image=frame,
-                        landmark_list=face_landmarks,
-                        connections=mp_face_mesh.FACEMESH_CONTOURS,
-                        landmark_drawing_spec=None,
-                        connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_contours_style()
-                    )
-                
-                # ============================================================
-                # EXTRACT EYE CONTOURS
-                # ============================================================
-                contour_droit = obtenir_points(landmarks, INDICES_OEIL_DROIT, largeur, hauteur)
-                contour_gauche = obtenir_points(landmarks, INDICES_OEIL_GAUCHE, largeur, hauteur)
-                pts_ear_droit = obtenir_points(landmarks, POINTS_EAR_DROIT, largeur, hauteur)
-                pts_ear_gauche = obtenir_points(landmarks, POINTS_EAR_GAUCHE, largeur, hauteur)
-                
-                # ============================================================
-                # CALCULATE EAR
-                # ============================================================
-                ear_droit = calculer_ear(pts_ear_droit)
-                ear_gauche = calculer_ear(pts_ear_gauche)
-                oeil_droit_ferme = ear_droit < SEUIL_EAR
-                oeil_gauche_ferme = ear_gauche < SEUIL_EAR
-                les_deux_yeux_fermes = oeil_droit_ferme and oeil_gauche_ferme
-                
-                # ============================================================
-                # EXTRACT MOUTH
-                # ============================================================
-                contour_bouche = obtenir_points(landmarks, INDICES_BOUCHE, largeur, hauteur)
-                pts_mar = obtenir_points(landmarks, POINTS_MAR, largeur, hauteur)
-                mar = calculer_mar(pts_mar)
-                baillement_detecte = mar > SEUIL_MAR
-                
-                # ============================================================
-                # DRAW CONTOURS
-                # ============================================================
-                couleur_droit = (0, 0, 255) if oeil_droit_ferme else (0, 255, 0)
-                couleur_gauche = (0, 0, 255) if oeil_gauche_ferme else (0, 255, 0)
-                couleur_bouche = (0, 165, 255) if baillement_detecte else (0, 255, 0)
-                
-                dessiner_contour_oeil(frame, contour_droit, couleur_droit, 2)
-                dessiner_contour_oeil(frame, contour_gauche, couleur_gauche, 2)
-                dessiner_contour_bouche(frame, contour_bouche, couleur_bouche, 2)
-                
-                # ============================================================
-                # DROWSINESS DETECTION
-                # ============================================================
-                if les_deux_yeux_fermes:
-                    compteur_fermeture += 1
-                    if compteur_fermeture >= FRAMES_ALERTE:
-                        if temps_actuel - dernier_alerte > COOLDOWN_ALERTE:
-                            alerte_active = True
-                            dernier_alerte = temps_actuel
-                            duree = compteur_fermeture / FPS
-                            print(f"⚠️  DROWSINESS ALERT! Both eyes closed for {duree:.1f}s")
-                else:
-                    compteur_fermeture = 0
-                    alerte_active = False
-                
-                # ============================================================
-                # YAWN DETECTION
-                # ============================================================
-                if baillement_detecte:
-                    compteur_baillement += 1
-                    if compteur_baillement >= FRAMES_ALERTE_BAILLEMENT:
-                        if temps_actuel - dernier_alerte_baillement > COOLDOWN_ALERTE:
-                            alerte_baillement_active = True
-                            dernier_alerte_baillement = temps_actuel
-                            duree = compteur_baillement / FPS
-                            print(f"🥱 YAWN ALERT! Duration {duree:.1f}s")
-                else:
-                    compteur_baillement = 0
-                    alerte_baillement_active = False
-        
+        for lm in visages_px:
+            
+            # ============================================================
+            # DRAW FACE MESH
+            # ============================================================
+            if mode_mesh == 1:
+                dessiner_mesh(frame, lm, segments_tesselation)
+            elif mode_mesh == 2:
+                dessiner_mesh(frame, lm, segments_contours)
+            
+            # ============================================================
+            # EXTRACT EYE CONTOURS
+            # ============================================================
+            contour_droit = lm[_IDX_OEIL_DROIT].astype(np.int32)
+            contour_gauche = lm[_IDX_OEIL_GAUCHE].astype(np.int32)
+            
+            # ============================================================
+            # CALCULATE EAR & MAR
+            # ============================================================
+            # Both EARs and the MAR in one compiled call on the full landmark array
+            ear_droit, ear_gauche, mar = compute_ratios(lm, ALL_PAIRS)
+            oeil_droit_ferme = ear_droit < SEUIL_EAR
+            oeil_gauche_ferme = ear_gauche < SEUIL_EAR
+            les_deux_yeux_fermes = oeil_droit_ferme and oeil_gauche_ferme
+            
+            # ============================================================
+            # EXTRACT MOUTH
+            # ============================================================
+            contour_bouche = lm[_IDX_BOUCHE].astype(np.int32)
+            baillement_detecte = mar > SEUIL_MAR
+            
+            # ============================================================
+            # DRAW CONTOURS
+            # ============================================================
+            couleur_droit = (0, 0, 255) if oeil_droit_ferme else (0, 255, 0)
+            couleur_gauche = (0, 0, 255) if oeil_gauche_ferme else (0, 255, 0)
+            couleur_bouche = (0, 165, 255) if baillement_detecte else (0, 255, 0)
+            
+            dessiner_contour_oeil(frame, contour_droit, couleur_droit, 2)
+            dessiner_contour_oeil(frame, contour_gauche, couleur_gauche, 2)
+            dessiner_contour_bouche(frame, contour_bouche, couleur_bouche, 2)
+            
+            # ============================================================
+            # DROWSINESS DETECTION
+            # ============================================================
+            if les_deux_yeux_fermes:
+                compteur_fermeture += 1
+                if compteur_fermeture >= FRAMES_ALERTE:
+                    if temps_actuel - dernier_alerte > COOLDOWN_ALERTE:
+                        alerte_active = True
+                        dernier_alerte = temps_actuel
+                        duree = compteur_fermeture / FPS
+                        print(f"⚠️  DROWSINESS ALERT! Both eyes closed for {duree:.1f}s")
+            else:
+                compteur_fermeture = 0
+                alerte_active = False
+            
+            # ============================================================
+            # YAWN DETECTION
+            # ============================================================
+            if baillement_detecte:
+                compteur_baillement += 1
+                if compteur_baillement >= FRAMES_ALERTE_BAILLEMENT:
+                    if temps_actuel - dernier_alerte_baillement > COOLDOWN_ALERTE:
+                        alerte_baillement_active = True
+                        dernier_alerte_baillement = temps_actuel
+                        duree = compteur_baillement / FPS
+                        print(f"🥱 YAWN ALERT! Duration {duree:.1f}s")
+            else:
+                compteur_baillement = 0
+                alerte_baillement_active = False
+    
         # ====================================================================
         # EMOTION DETECTION (THREADED)
         # ====================================================================
-        if emotion_detector.should_analyze():
-            # Capture frame for analysis
-            analysis_frame = frame.copy()
-            # Run in thread to avoid blocking
-            thread = threading.Thread(target=emotion_detector.analyze_frame, args=(analysis_frame,))
-            thread.daemon = True
-            thread.start()
+        if emotion_detector.should_analyze(temps_actuel):
+            # Copy into a persistent scratch buffer (free: should_analyze() is False while
+            # the worker still holds the previous one) and hand it to the persistent worker
+            if emotion_buf is None or emotion_buf.shape != frame.shape:
+                emotion_buf = np.empty_like(frame)
+            np.copyto(emotion_buf, frame)
+            emotion_detector.submit(emotion_buf)
         
         # ====================================================================
         # USER INTERFACE
         # ====================================================================
         
-        # Main panel (top)
-        panel_x, panel_y = 10, 8
-        panel_w = min(630, largeur - 20)
-        panel_h = 280
+        # Static chrome (titles, labels, separators, frames) is rendered once and rebuilt on change
+        cle_hud = (largeur, hauteur, mode_mesh, emotion_detector.enabled)
+        if cle_hud != hud_cle:
+            hud_bg, hud_where = build_hud(*cle_hud)
+            hud_cle = cle_hud
         
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (panel_x, panel_y), (panel_x + panel_w, panel_y + panel_h), (25, 25, 25), -1)
-        cv2.addWeighted(overlay, 0.78, frame, 0.22, 0, frame)
+        # Main panel (top)
+        panel_x, panel_y = PANEL_X, PANEL_Y
+        panel_w = min(PANEL_W, largeur - 20)
+        panel_h = PANEL_H
+        bx, by = panel_x + 12, panel_y + 56
+        bx2, by2 = bx, by + EAR_BOX_H + 6
+        emotion_panel_x, emotion_panel_y = position_panneau_emotion(largeur, hauteur)
+        emotion_panel_h = EMOTION_PANEL_H
         
-        # Title
-        title = "DROWSINESS & EMOTION DETECTOR"
-        draw_text_shadow(frame, title, (panel_x + 14, panel_y + 36), cv2.FONT_HERSHEY_DUPLEX, 0.8, (245,245,245), thickness=2)
-        cv2.line(frame, (panel_x + 10, panel_y + 46), (panel_x + panel_w - 10, panel_y + 46), (90, 90, 90), 1)
+        # Translucent backgrounds blend with the live frame, then the chrome is blitted on top
+        blend_rect(frame, panel_x, panel_y, panel_w, panel_h, (25, 25, 25), 0.78)
+        blend_rect(frame, bx, by, EAR_BOX_W, EAR_BOX_H, (100, 100, 100), 0.75)
+        blend_rect(frame, bx2, by2, EAR_BOX_W, EAR_BOX_H, (100, 100, 100), 0.75)
+        if emotion_detector.enabled:
+            blend_rect(frame, emotion_panel_x, emotion_panel_y, EMOTION_PANEL_W, emotion_panel_h, (25, 25, 25), 0.85)
+        np.copyto(frame, hud_bg, where=hud_where)
         
         # EAR values (left side)
-        ear_box_w = 260
-        ear_box_h = 38
-        bx, by = panel_x + 12, panel_y + 56
-        draw_text_box(frame, "", (bx, by), ear_box_w, ear_box_h)
         draw_text_shadow(frame, f"EAR Droit: {ear_droit:.3f}", (bx + 10, by + 26), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (180,180,255), thickness=1)
-        
-        bx2, by2 = panel_x + 12, panel_y + 56 + ear_box_h + 6
-        draw_text_box(frame, "", (bx2, by2), ear_box_w, ear_box_h)
         draw_text_shadow(frame, f"EAR Gauche: {ear_gauche:.3f}", (bx2 + 10, by2 + 26), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,180,180), thickness=1)
         
         # Eye states (right side)
-        eye_x, eye_y = panel_x + ear_box_w + 36, panel_y + 80
+        eye_x, eye_y = panel_x + EAR_BOX_W + 36, panel_y + 80
         couleur_droit = (0, 0, 255) if oeil_droit_ferme else (0, 200, 0)
         couleur_gauche = (0, 0, 255) if oeil_gauche_ferme else (0, 200, 0)
         cv2.circle(frame, (eye_x, eye_y), 12, couleur_droit, -1)
-        draw_text_shadow(frame, "Droit", (eye_x + 22, eye_y + 6), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (230,230,230), thickness=1)
         cv2.circle(frame, (eye_x, eye_y + 36), 12, couleur_gauche, -1)
-        draw_text_shadow(frame, "Gauche", (eye_x + 22, eye_y + 42), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (230,230,230), thickness=1)
         
         # Status
         status_x, status_y = panel_x + 14, panel_y + 150
         if les_deux_yeux_fermes:
-            draw_text_shadow(frame, "LES DEUX YEUX FERMES", (status_x, status_y), cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 165, 255), thickness=2)
+            draw_text_cached(frame, "LES DEUX YEUX FERMES", (status_x, status_y), cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 165, 255), thickness=2)
         else:
-            draw_text_shadow(frame, "Au moins un oeil ouvert", (status_x, status_y), cv2.FONT_HERSHEY_DUPLEX, 0.65, (0, 220, 0), thickness=2)
+            draw_text_cached(frame, "Au moins un oeil ouvert", (status_x, status_y), cv2.FONT_HERSHEY_DUPLEX, 0.65, (0, 220, 0), thickness=2)
         
         # Progress bars
         pb_x, pb_y = panel_x + 14, panel_y + 170
-        cv2.line(frame, (panel_x + 10, pb_y - 8), (panel_x + panel_w - 10, pb_y - 8), (90, 90, 90), 1)
         
         y_pos = pb_y
         if compteur_fermeture > 0:
@@ -353,7 +634,7 @@ def main():
             prog_yeux = min(int((compteur_fermeture / FRAMES_ALERTE) * 100), 100)
             draw_text_shadow(frame, f"Yeux fermes: {duree_yeux:.1f}s", (pb_x, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,200,0), thickness=1)
             draw_progress_bar(frame, (pb_x, y_pos + 12), 280, 16, prog_yeux, bg_color=(60,60,60), fg_color=(0,0,220))
-            draw_text_shadow(frame, f"{prog_yeux}%", (pb_x + 290, y_pos + 14), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), thickness=1)
+            draw_text_cached(frame, f"{prog_yeux}%", (pb_x + 290, y_pos + 14), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), thickness=1)
             y_pos += 36
         
         if compteur_baillement > 0:
@@ -361,81 +642,59 @@ def main():
             prog_bail = min(int((compteur_baillement / FRAMES_ALERTE_BAILLEMENT) * 100), 100)
             draw_text_shadow(frame, f"Baillement: {duree_bail:.1f}s", (pb_x, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,165,0), thickness=1)
             draw_progress_bar(frame, (pb_x, y_pos + 12), 280, 16, prog_bail, bg_color=(60,60,60), fg_color=(0,165,255))
-            draw_text_shadow(frame, f"{prog_bail}%", (pb_x + 290, y_pos + 14), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), thickness=1)
-        
-        # Instructions
-        mode_texte = ["Tesselation", "Contours", "Points"][mode_mesh - 1]
-        draw_text_shadow(frame, f"Mesh: {mode_texte} [M] | Emotion [E] | Quit [Q]", 
-                        (panel_x + 14, panel_y + panel_h - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,200), thickness=1)
+            draw_text_cached(frame, f"{prog_bail}%", (pb_x + 290, y_pos + 14), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), thickness=1)
         
         # ====================================================================
         # EMOTION PANEL (Right side)
         # ====================================================================
         if emotion_detector.enabled:
-            emotion_panel_x = largeur - 320
-            emotion_panel_y = 10
-            emotion_panel_w = 300
-            emotion_panel_h = 220
-            
-            # Background
-            overlay = frame.copy()
-            cv2.rectangle(overlay, (emotion_panel_x, emotion_panel_y), 
-                         (emotion_panel_x + emotion_panel_w, emotion_panel_y + emotion_panel_h), (25, 25, 25), -1)
-            cv2.addWeighted(overlay, 0.85, frame, 0.15, 0, frame)
-            cv2.rectangle(frame, (emotion_panel_x, emotion_panel_y), 
-                         (emotion_panel_x + emotion_panel_w, emotion_panel_y + emotion_panel_h), (0, 255, 100), 2)
-            
-            # Title
-            draw_text_shadow(frame, "EMOTION DETECTION", (emotion_panel_x + 15, emotion_panel_y + 30), 
-                           cv2.FONT_HERSHEY_DUPLEX, 0.7, (255, 255, 255), thickness=2)
+            # One read of the published result per frame (swapped atomically by the worker)
+            resultat_emotion = emotion_detector.snapshot
             
             # Status
             if emotion_detector.is_analyzing:
-                draw_text_shadow(frame, "Analyzing...", (emotion_panel_x + 15, emotion_panel_y + 65), 
+                draw_text_cached(frame, "Analyzing...", (emotion_panel_x + 15, emotion_panel_y + 65), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), thickness=2)
-            elif emotion_detector.current_emotion:
+            elif resultat_emotion.emotion:
                 # Show current emotion
-                draw_text_shadow(frame, emotion_detector.current_emotion.upper(), 
+                draw_text_cached(frame, resultat_emotion.emotion.upper(), 
                                (emotion_panel_x + 15, emotion_panel_y + 75), 
                                cv2.FONT_HERSHEY_DUPLEX, 1.2, (0, 255, 0), thickness=3)
                 
                 # Show all emotions
                 y_offset = 110
-                sorted_emotions = sorted(emotion_detector.emotion_scores.items(), key=lambda x: x[1], reverse=True)
-                for emotion, score in sorted_emotions:
-                    if emotion == 'happy':
-                        color = (0, 255, 0)
-                    elif emotion == 'sad':
-                        color = (0, 100, 255)
-                    else:
-                        color = (200, 200, 0)
+                sorted_emotions = resultat_emotion.ranked
+                # All bar widths in one NumPy operation
+                bar_widths = (np.fromiter((score for _, score in sorted_emotions), np.float32,
+                                          count=len(sorted_emotions)) * (220 / 100)).astype(np.int32).tolist()
+                for (emotion, score), bar_width in zip(sorted_emotions, bar_widths):
+                    color = EMOTION_COULEURS.get(emotion, EMOTION_COULEUR_DEFAUT)
                     
                     # Draw bar
-                    bar_width = int((score / 100) * 220)
                     cv2.rectangle(frame, (emotion_panel_x + 15, y_offset - 10), 
                                  (emotion_panel_x + 15 + bar_width, y_offset + 5), color, -1)
                     
                     # Draw text
                     text = f"{emotion.capitalize()}: {score:.1f}%"
-                    draw_text_shadow(frame, text, (emotion_panel_x + 20, y_offset), 
+                    draw_text_cached(frame, text, (emotion_panel_x + 20, y_offset), 
                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), thickness=1)
                     y_offset += 30
             else:
-                draw_text_shadow(frame, "Waiting...", (emotion_panel_x + 15, emotion_panel_y + 65), 
+                draw_text_cached(frame, "Waiting...", (emotion_panel_x + 15, emotion_panel_y + 65), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (150, 150, 150), thickness=2)
             
             # Countdown
-            time_until_next = emotion_detector.get_time_until_next()
+            time_until_next = emotion_detector.get_time_until_next(temps_actuel)
             countdown_text = f"Next: {int(time_until_next)}s"
-            draw_text_shadow(frame, countdown_text, (emotion_panel_x + 15, emotion_panel_y + emotion_panel_h - 15), 
+            draw_text_cached(frame, countdown_text, (emotion_panel_x + 15, emotion_panel_y + emotion_panel_h - 15), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), thickness=1)
         
         # ====================================================================
         # ALERTS
         # ====================================================================
         if alerte_active:
-            if frame_count % 10 < 5:
-                cv2.rectangle(frame, (0, 0), (largeur, hauteur), (0, 0, 255), 20)
+            if _BLINK[frame_count % len(_BLINK)]:
+                dessiner_bordure(frame, (0, 0, 255), 10)
             cv2.putText(frame, "⚠️ SOMNOLENCE DETECTEE ⚠️", (50, hauteur - 120),
                        cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)
             cv2.putText(frame, "LES DEUX YEUX SONT FERMES !", (80, hauteur - 70),
@@ -446,7 +705,9 @@ def main():
         # ====================================================================
         cv2.imshow("Drowsiness & Emotion Detector", frame)
         
-        key = cv2.waitKey(1) & 0xFF
+        # pollKey() (OpenCV >= 4.5, requirements.txt pins 4.10) pumps window events
+        # without waitKey(1)'s 1 ms floor
+        key = cv2.pollKey() & 0xFF
         if key == ord('q') or key == ord('Q'):
             break
         elif key == ord('m') or key == ord('M'):
@@ -463,8 +724,12 @@ def main():
     # ========================================================================
     # CLEANUP
     # ========================================================================
+    grabber.stop()
     cap.release()
-    face_mesh.close()
+    if landmarker is not None:
+        landmarker.close()
+    else:
+        face_mesh.close()
     cv2.destroyAllWindows()
     
     print("\n" + "=" * 70)
@@ -0,0 +1,87 @@
+"""
+MJPEG-over-HTTP Stream Reader
+Reads a DroidCam-style multipart JPEG stream directly (no FFmpeg)
+Same read/grab/retrieve interface as cv2.VideoCapture
+"""
+import urllib.request
+import cv2
+import numpy as np
+
+
+# JPEG start / end of image markers
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+
+
+class MJPEGStream:
+    """
+    Minimal MJPEG stream reader
+    grab() only extracts the JPEG bytes, retrieve() decodes the last grabbed one,
+    so frames that are skipped are never decoded
+    """
+    
+    def __init__(self, url, timeout=5.0, chunk_size=4096):
+        self.url = url
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._jpeg = None
+        
+        try:
+            self._response = urllib.request.urlopen(url, timeout=timeout)
+        except Exception as e:
+            print(f"❌ Cannot open MJPEG stream: {e}")
+            self._response = None
+    
+    def isOpened(self):
+        """Check if the HTTP stream is open"""
+        return self._response is not None
+    
+    def grab(self):
+        """Read the next JPEG from the stream without decoding it"""
+        if self._response is None:
+            return False
+        
+        try:
+            while True:
+                start = self._buffer.find(JPEG_SOI)
+                if start != -1:
+                    end = self._buffer.find(JPEG_EOI, start + 2)
+                    if end != -1:
+                        self._jpeg = bytes(self._buffer[start:end + 2])
+                        del self._buffer[:end + 2]
+                        return True
+                elif len(self._buffer) > 1:
+                    # No image started yet: drop multipart headers (keep a possible half marker)
+                    del self._buffer[:-1]
+                
+                chunk = self._response.read1(self.chunk_size)
+                if not chunk:
+                    return False
+                self._buffer += chunk
+        
+        except Exception as e:
+            print(f"⚠️  MJPEG stream read error: {e}")
+            return False
+    
+    def retrieve(self):
+        """Decode the last grabbed JPEG"""
+        if self._jpeg is None:
+            return False, None
+        frame = cv2.imdecode(np.frombuffer(self._jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return frame is not None, frame
+    
+    def read(self):
+        """Grab and decode the next frame"""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+    
+    def set(self, prop_id, value):
+        """Capture properties are not supported on a raw HTTP stream"""
+        return False
+    
+    def release(self):
+        """Close the HTTP connection"""
+        if self._response is not None:
+            self._response.close()
+            self._response = None
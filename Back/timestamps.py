@@ -0,0 +1,20 @@
+"""
+Shared ISO timestamps
+One per-second cache used by the API, the detection loop and Firebase
+"""
+import time
+from datetime import datetime
+
+
+# Cached ISO timestamp: (second, formatted string), rebound atomically
+_ts_cache = (0, "")
+
+
+def now_iso() -> str:
+    """Current time as an ISO string (second precision), formatted at most once per second"""
+    global _ts_cache
+    t = int(time.time())
+    cache = _ts_cache
+    if t != cache[0]:
+        cache = _ts_cache = (t, datetime.fromtimestamp(t).isoformat())
+    return cache[1]
@@ -2,255 +2,284 @@
 """
 Emotion Detection Integration Verification
 Checks if all components are properly integrated
+
+Usage: python verify_integration.py [--fast]
 """
 
 import os
+import re
 import sys
+import functools
 import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Report lines, written to stdout in one call per section instead of one print() per line
+_OUTPUT = []
+
+def report(line=""):
+    """Queue one line of the report"""
+    _OUTPUT.append(f"{line}\n")
+
+def flush_report():
+    """Write the queued report lines at once"""
+    sys.stdout.writelines(_OUTPUT)
+    sys.stdout.flush()
+    _OUTPUT.clear()
 
-def check_file_exists(filepath, description):
-    """Check if a file exists"""
-    if os.path.exists(filepath):
-        print(f"✅ {description}")
+# File contents already read, keyed by path (several checks look at the same file)
+_FILE_CACHE = {}
+
+def _read(filepath):
+    """Read a file once as raw bytes (never decoded) and return the cached contents"""
+    content = _FILE_CACHE.get(filepath)
+    if content is None:
+        content = Path(filepath).read_bytes()
+        _FILE_CACHE[filepath] = content
+    return content
+
+# Needle -> found, per file path (filled by scan_files, one pass per file)
+_MATCHES = {}
+
+def _scan_file(filepath, needles):
+    """Search all needles of one file in one regex pass: {needle: found} (None if unreadable)"""
+    try:
+        content = _read(filepath)
+    except OSError:
+        return None  # Reported by check_string_in_file
+    # Search the raw bytes (needles encoded once per file, duplicates dropped)
+    encoded = {n: n.encode() for n in needles}
+    unique = set(encoded.values())
+    # Longest first, so a needle that prefixes another can't shadow it in the alternation
+    pattern = re.compile(b"|".join(re.escape(b) for b in sorted(unique, key=len, reverse=True)))
+    found = set()
+    for m in pattern.finditer(content):
+        found.add(m.group(0))
+        if len(found) == len(unique):
+            break  # Every needle seen, skip the rest of the file
+    # A needle hidden inside an overlapping match is rechecked directly
+    return {n: b in found or b in content for n, b in encoded.items()}
+
+def scan_files(paths, searches):
+    """Scan every file named in searches concurrently, searches: [(filename, needle)], paths: {filename: path}"""
+    needles_by_file = {}
+    for filename, search_string in searches:
+        needles_by_file.setdefault(paths[filename], []).append(search_string)
+    
+    # File I/O releases the GIL: one thread per file (results are printed afterwards, in order)
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        results = ex.map(_scan_file, needles_by_file.keys(), needles_by_file.values())
+        for filepath, matches in zip(needles_by_file, results):
+            if matches is not None:
+                _MATCHES.setdefault(filepath, {}).update(matches)
+
+def check_file_exists(name, description, entries, nonempty=False):
+    """Check if a file exists, and optionally isn't empty (entries: {name: DirEntry} listed once)"""
+    entry = entries.get(name)
+    if entry is not None and (not nonempty or entry.stat().st_size > 0):
+        report(f"✅ {description}")
         return True
     else:
-        print(f"❌ {description}")
+        report(f"❌ {description}")
         return False
 
+@functools.lru_cache(maxsize=None)
+def _has_module(module_name):
+    """Whether a module is found on sys.path (memoized, each name walks sys.path once)"""
+    return importlib.util.find_spec(module_name) is not None
+
 def check_module_importable(module_name):
-    """Check if a Python module can be imported"""
+    """Check if a Python module is installed (found on sys.path, without running it)"""
     try:
-        importlib.import_module(module_name)
-        print(f"✅ {module_name} can be imported")
+        found = _has_module(module_name)
+    except (ImportError, ValueError) as e:
+        report(f"❌ {module_name} cannot be imported: {e}")
+        return False
+    if found:
+        report(f"✅ {module_name} can be imported")
         return True
-    except ImportError as e:
-        print(f"❌ {module_name} cannot be imported: {e}")
+    else:
+        report(f"❌ {module_name} cannot be imported: No module named '{module_name}'")
         return False
 
 def check_string_in_file(filepath, search_string, description):
     """Check if a string exists in a file"""
     try:
-        with open(filepath, 'r') as f:
-            content = f.read()
-            if search_string in content:
-                print(f"✅ {description}")
-                return True
-            else:
-                print(f"❌ {description}")
-                return False
+        found = _MATCHES.get(filepath, {}).get(search_string)
+        if found is None:
+            found = search_string.encode() in _read(filepath)
+        if found:
+            report(f"✅ {description}")
+            return True
+        else:
+            report(f"❌ {description}")
+            return False
     except Exception as e:
-        print(f"❌ Error checking file: {e}")
+        report(f"❌ Error checking file: {e}")
         return False
 
-def main():
-    print("=" * 70)
-    print("EMOTION DETECTION INTEGRATION VERIFICATION")
-    print("=" * 70)
-    print()
-    
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    
-    all_checks_passed = True
-    
-    # ====================================================================
-    # 1. Check Files Exist
-    # ====================================================================
-    print("1️⃣  CHECKING FILES")
-    print("-" * 70)
-    
-    files_to_check = [
-        ("main.py", "main.py exists"),
-        ("continuous_detector.py", "continuous_detector.py exists"),
-        ("models.py", "models.py exists"),
-        ("requirements.txt", "requirements.txt exists"),
-        ("EMOTION_INTEGRATION.md", "EMOTION_INTEGRATION.md documentation exists"),
-        ("EMOTION_CONFIG.md", "EMOTION_CONFIG.md documentation exists"),
-        ("test_emotions.py", "test_emotions.py test suite exists"),
-    ]
-    
-    for filename, description in files_to_check:
-        filepath = os.path.join(base_path, filename)
-        if not check_file_exists(filepath, description):
-            all_checks_passed = False
-    
-    print()
-    
-    # ====================================================================
-    # 2. Check Code Integration
-    # ====================================================================
-    print("2️⃣  CHECKING CODE INTEGRATION")
-    print("-" * 70)
-    
-    # Check continuous_detector.py has EmotionDetector
-    if check_string_in_file(
-        os.path.join(base_path, "continuous_detector.py"),
-        "class EmotionDetector",
-        "EmotionDetector class in continuous_detector.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    # Check continuous_detector.py imports deepface
-    if check_string_in_file(
-        os.path.join(base_path, "continuous_detector.py"),
-        "from deepface import DeepFace",
-        "DeepFace import in continuous_detector.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    # Check models.py has EmotionResponse
-    if check_string_in_file(
-        os.path.join(base_path, "models.py"),
-        "class EmotionResponse",
-        "EmotionResponse model in models.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    # Check models.py has CombinedDetectionResponse
-    if check_string_in_file(
-        os.path.join(base_path, "models.py"),
-        "class CombinedDetectionResponse",
-        "CombinedDetectionResponse model in models.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    # Check main.py has new endpoints
-    if check_string_in_file(
-        os.path.join(base_path, "main.py"),
-        "@app.get(\"/emotions/current\"",
-        "/emotions/current endpoint in main.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    if check_string_in_file(
-        os.path.join(base_path, "main.py"),
-        "@app.get(\"/detect/combined\"",
-        "/detect/combined endpoint in main.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    # Check imports in main.py
-    if check_string_in_file(
-        os.path.join(base_path, "main.py"),
-        "EmotionResponse, CombinedDetectionResponse",
-        "Emotion models imported in main.py"
-    ):
-        pass
-    else:
-        all_checks_passed = False
-    
-    print()
-    
-    # ====================================================================
-    # 3. Check Dependencies
-    # ====================================================================
-    print("3️⃣  CHECKING DEPENDENCIES")
-    print("-" * 70)
-    
-    # Check requirements.txt
-    if check_string_in_file(
-        os.path.join(base_path, "requirements.txt"),
-        "deepface",
-        "deepface in requirements.txt"
-    ):
-        pass
-    else:
-        all_checks_passed = False
+# ============================================================================
+# CHECK TABLE
+# ============================================================================
+# type 'file': file exists (nonempty=True: and isn't empty), 'str': needle found in file,
+# 'mod': package installed
+# required=False checks are reported but don't fail the verification
+
+SECTION_TITLES = {
+    1: "1️⃣  CHECKING FILES",
+    2: "2️⃣  CHECKING CODE INTEGRATION",
+    3: "3️⃣  CHECKING DEPENDENCIES",
+    4: "4️⃣  CHECKING DOCUMENTATION",
+}
+
+CHECKS = [
+    # 1. Files exist
+    {'section': 1, 'type': 'file', 'path': "main.py", 'desc': "main.py exists"},
+    {'section': 1, 'type': 'file', 'path': "continuous_detector.py", 'desc': "continuous_detector.py exists"},
+    {'section': 1, 'type': 'file', 'path': "models.py", 'desc': "models.py exists"},
+    {'section': 1, 'type': 'file', 'path': "requirements.txt", 'desc': "requirements.txt exists"},
+    {'section': 1, 'type': 'file', 'path': "EMOTION_INTEGRATION.md", 'desc': "EMOTION_INTEGRATION.md documentation exists"},
+    {'section': 1, 'type': 'file', 'path': "EMOTION_CONFIG.md", 'desc': "EMOTION_CONFIG.md documentation exists"},
+    {'section': 1, 'type': 'file', 'path': "test_emotions.py", 'desc': "test_emotions.py test suite exists"},
     
-    if check_string_in_file(
-        os.path.join(base_path, "requirements.txt"),
-        "tensorflow",
-        "tensorflow in requirements.txt"
-    ):
-        pass
-    else:
-        all_checks_passed = False
+    # 2. Code integration
+    {'section': 2, 'type': 'str', 'path': "continuous_detector.py", 'needle': "class EmotionDetector",
+     'desc': "EmotionDetector class in continuous_detector.py"},
+    {'section': 2, 'type': 'str', 'path': "continuous_detector.py", 'needle': "from deepface import DeepFace",
+     'desc': "DeepFace import in continuous_detector.py"},
+    {'section': 2, 'type': 'str', 'path': "models.py", 'needle': "class EmotionResponse",
+     'desc': "EmotionResponse model in models.py"},
+    {'section': 2, 'type': 'str', 'path': "models.py", 'needle': "class CombinedDetectionResponse",
+     'desc': "CombinedDetectionResponse model in models.py"},
+    {'section': 2, 'type': 'str', 'path': "main.py", 'needle': "@app.get(\"/emotions/current\"",
+     'desc': "/emotions/current endpoint in main.py"},
+    {'section': 2, 'type': 'str', 'path': "main.py", 'needle': "@app.get(\"/detect/combined\"",
+     'desc': "/detect/combined endpoint in main.py"},
+    {'section': 2, 'type': 'str', 'path': "main.py", 'needle': "EmotionResponse, CombinedDetectionResponse",
+     'desc': "Emotion models imported in main.py"},
     
-    # Check if deepface can be imported
-    print()
-    print("Checking installed packages...")
-    print("-" * 70)
+    # 3. Dependencies
+    {'section': 3, 'type': 'str', 'path': "requirements.txt", 'needle': "deepface", 'desc': "deepface in requirements.txt"},
+    {'section': 3, 'type': 'str', 'path': "requirements.txt", 'needle': "tensorflow", 'desc': "tensorflow in requirements.txt"},
+    {'section': 3, 'type': 'mod', 'name': "fastapi", 'required': False,
+     'before': "\nChecking installed packages...\n" + "-" * 70},
+    {'section': 3, 'type': 'mod', 'name': "cv2", 'required': False},
+    {'section': 3, 'type': 'mod', 'name': "mediapipe", 'required': False},
+    {'section': 3, 'type': 'mod', 'name': "pydantic", 'required': False},
+    # Deepface is optional (might not be installed yet)
+    {'section': 3, 'type': 'mod', 'name': "deepface", 'required': False, 'before': "",
+     'ok_note': "   ✅ DeepFace is installed",
+     'fail_note': "   ⚠️  DeepFace not installed - install with: pip install -r requirements.txt"},
     
-    modules_to_check = [
-        ("fastapi", "FastAPI"),
-        ("cv2", "OpenCV"),
-        ("mediapipe", "MediaPipe"),
-        ("pydantic", "Pydantic"),
-    ]
+    # 4. Documentation (informational)
+    {'section': 4, 'type': 'file', 'path': "README.md", 'desc': "README updated with emotion info", 'required': False},
+    {'section': 4, 'type': 'file', 'path': "EMOTION_INTEGRATION.md", 'desc': "Complete integration guide", 'required': False},
+    {'section': 4, 'type': 'file', 'path': "EMOTION_CONFIG.md", 'desc': "Configuration guide", 'required': False},
+    {'section': 4, 'type': 'file', 'path': "QUICK_START.md", 'desc': "Quick start guide", 'required': False},
+    {'section': 4, 'type': 'file', 'path': "CHANGELOG.md", 'desc': "Changelog", 'required': False},
+    {'section': 4, 'type': 'file', 'path': "INTEGRATION_SUMMARY.md", 'desc': "Integration summary", 'required': False},
+]
+
+def run_check(check, paths, entries):
+    """Run one entry of CHECKS and return whether it passed (paths: {filename: path})"""
+    kind = check['type']
+    if kind == 'file':
+        return check_file_exists(check['path'], check['desc'], entries, check.get('nonempty', False))
+    if kind == 'str':
+        # Missing file: known from the directory listing, no failed open() to catch
+        if check['path'] not in entries:
+            report(f"❌ {check['desc']} ({check['path']} not found)")
+            return False
+        return check_string_in_file(paths[check['path']], check['needle'], check['desc'])
+    if kind == 'mod':
+        return check_module_importable(check['name'])
+    raise ValueError(f"Unknown check type: {kind}")
+
+def main(fast_fail=False):
+    """Run every check; fast_fail (--fast) stops at the first failed required check"""
+    report("=" * 70)
+    report("EMOTION DETECTION INTEGRATION VERIFICATION")
+    report("=" * 70)
+    report()
     
-    for module_name, display_name in modules_to_check:
-        check_module_importable(module_name)
+    base_path = Path(__file__).resolve().parent
     
-    # Deepface is optional (might not be installed yet)
-    print()
-    if check_module_importable("deepface"):
-        print("   ✅ DeepFace is installed")
-    else:
-        print("   ⚠️  DeepFace not installed - install with: pip install -r requirements.txt")
+    # One directory listing instead of a stat per checked file
+    # (DirEntry caches its stat, so size checks cost at most one call per file)
+    with os.scandir(base_path) as it:
+        entries = {entry.name: entry for entry in it}
     
-    print()
+    # Full path of every file named in CHECKS, joined once
+    paths = {c['path']: base_path / c['path'] for c in CHECKS if 'path' in c}
     
-    # ====================================================================
-    # 4. Check Documentation
-    # ====================================================================
-    print("4️⃣  CHECKING DOCUMENTATION")
-    print("-" * 70)
+    # Scan every searched file once, in one pass per file
+    # (fast mode searches lazily instead, an early failure then skips the remaining files)
+    if not fast_fail:
+        scan_files(paths, [(c['path'], c['needle']) for c in CHECKS if c['type'] == 'str' and c['path'] in entries])
     
-    docs = [
-        ("README.md", "README updated with emotion info"),
-        ("EMOTION_INTEGRATION.md", "Complete integration guide"),
-        ("EMOTION_CONFIG.md", "Configuration guide"),
-        ("QUICK_START.md", "Quick start guide"),
-        ("CHANGELOG.md", "Changelog"),
-        ("INTEGRATION_SUMMARY.md", "Integration summary"),
-    ]
+    all_checks_passed = True
+    section = None
     
-    for filename, description in docs:
-        filepath = os.path.join(base_path, filename)
-        check_file_exists(filepath, description)
+    for check in CHECKS:
+        if check['section'] != section:
+            if section is not None:
+                report()
+                flush_report()
+            section = check['section']
+            report(SECTION_TITLES[section])
+            report("-" * 70)
+        
+        if 'before' in check:
+            report(check['before'])
+        
+        ok = run_check(check, paths, entries)
+        # Informational checks never fail the verification
+        passed = ok or not check.get('required', True)
+        all_checks_passed &= passed
+        if fast_fail and not passed:
+            report()
+            report("❌ INTEGRATION VERIFICATION FAILED! (--fast: stopped at first failure)")
+            flush_report()
+            return 1
+        
+        note = check.get('ok_note' if ok else 'fail_note')
+        if note:
+            report(note)
     
-    print()
+    report()
     
     # ====================================================================
     # Summary
     # ====================================================================
-    print("=" * 70)
+    report("=" * 70)
     if all_checks_passed:
-        print("✅ INTEGRATION VERIFICATION PASSED!")
-        print("=" * 70)
-        print()
-        print("🎉 All checks passed! Your emotion detection is integrated.")
-        print()
-        print("Next steps:")
-        print("  1. Install dependencies: pip install -r requirements.txt")
-        print("  2. Run backend: python main.py")
-        print("  3. Test emotions: python test_emotions.py")
-        print()
-        print("Or read: QUICK_START.md or INTEGRATION_SUMMARY.md")
+        report("✅ INTEGRATION VERIFICATION PASSED!")
+        report("=" * 70)
+        report()
+        report("🎉 All checks passed! Your emotion detection is integrated.")
+        report()
+        report("Next steps:")
+        report("  1. Install dependencies: pip install -r requirements.txt")
+        report("  2. Run backend: python main.py")
+        report("  3. Test emotions: python test_emotions.py")
+        report()
+        report("Or read: QUICK_START.md or INTEGRATION_SUMMARY.md")
+        flush_report()
         return 0
     else:
-        print("❌ INTEGRATION VERIFICATION FAILED!")
-        print("=" * 70)
-        print()
-        print("Some checks failed. Please review the items marked with ❌")
-        print()
-        print("Quick fixes:")
-        print("  1. Make sure you're in the right directory")
-        print("  2. Check that all files were created")
-        print("  3. Try reinstalling: pip install -r requirements.txt")
+        report("❌ INTEGRATION VERIFICATION FAILED!")
+        report("=" * 70)
+        report()
+        report("Some checks failed. Please review the items marked with ❌")
+        report()
+        report("Quick fixes:")
+        report("  1. Make sure you're in the right directory")
+        report("  2. Check that all files were created")
+        report("  3. Try reinstalling: pip install -r requirements.txt")
+        flush_report()
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
+    # --fast: exit non-zero at the first failed check (CI)
+    sys.exit(main(fast_fail="--fast" in sys.argv[1:]))
 